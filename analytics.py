@@ -0,0 +1,120 @@
+import logging
+from datetime import date, datetime, timedelta
+from typing import Dict, List
+import numpy as np
+from sqlalchemy import select, union_all
+from extensions import db
+from models import Cita, CitaArchivada
+from doctor_schedule import horarios_del_medico
+
+DIAS_SEMANA = ['lunes', 'martes', 'miércoles', 'jueves', 'viernes', 'sábado', 'domingo']
+
+def capacidad_por_hora(medico: Dict) -> np.ndarray:
+    """Huecos de cita que ofrece un médico en cada hora del día (vector de 24)"""
+    try:
+        horarios = horarios_del_medico(medico)
+    except (ValueError, TypeError) as e:
+        # Un horario mal cargado en el directorio no debe tumbar el informe entero
+        logging.error(f"Horario inválido del médico {medico.get('id')}, capacidad 0: {e}")
+        horarios = []
+    horas = np.array([h.hour for h in horarios], dtype=np.int64)
+    return np.bincount(horas, minlength=24)[:24]
+
+def _ratio(ocupadas: np.ndarray, capacidad: np.ndarray) -> np.ndarray:
+    return np.divide(ocupadas, capacidad, out=np.zeros(ocupadas.shape), where=capacidad > 0)
+
+def ocupacion(medicos: List[Dict], desde: date, hasta: date) -> Dict:
+    """Ocupación por médico, especialidad, día y hora entre desde y hasta (inclusive).
+
+    Las citas, vigentes y archivadas, se agregan en SQL por médico, día y hora;
+    la capacidad sale de la rejilla de huecos de cada médico y todo el cálculo
+    se hace con arrays.
+    """
+    dias = (hasta - desde).days + 1
+    indice_medico = {m['id']: i for i, m in enumerate(medicos)}
+    especialidades = sorted({m.get('especialidad') or 'Sin especialidad' for m in medicos})
+    indice_especialidad = {e: i for i, e in enumerate(especialidades)}
+
+    # Las citas antiguas ya están en cita_archivada: se agregan ambas tablas juntas
+    inicio = datetime.combine(desde, datetime.min.time())
+    fin = datetime.combine(hasta + timedelta(days=1), datetime.min.time())
+    citas = union_all(*[
+        select(modelo.medico_id, modelo.fecha_hora).where(
+            modelo.medico_id.in_(list(indice_medico)),
+            modelo.estado != 'cancelada',
+            modelo.fecha_hora >= inicio,
+            modelo.fecha_hora < fin
+        ) for modelo in (Cita, CitaArchivada)
+    ]).subquery()
+    dia = db.func.date(citas.c.fecha_hora)
+    hora = db.extract('hour', citas.c.fecha_hora)
+    filas = db.session.execute(
+        select(citas.c.medico_id, dia, hora, db.func.count()).group_by(citas.c.medico_id, dia, hora)
+    ).all()
+
+    # Citas ocupadas: médico x día x hora
+    ocupadas = np.zeros((len(medicos), dias, 24), dtype=np.int64)
+    if filas:
+        medico_ids, dias_str, horas, totales = zip(*filas)
+        m_idx = np.fromiter((indice_medico[m] for m in medico_ids), dtype=np.int64, count=len(filas))
+        d_idx = (np.array(dias_str, dtype='datetime64[D]') - np.datetime64(desde, 'D')).astype(np.int64)
+        np.add.at(ocupadas, (m_idx, d_idx, np.array(horas, dtype=np.int64)), np.array(totales))
+
+    # Capacidad: médico x hora (la misma todos los días)
+    capacidad = np.array([capacidad_por_hora(m) for m in medicos], dtype=np.int64).reshape(len(medicos), 24)
+    especialidad_idx = np.array([indice_especialidad[m.get('especialidad') or 'Sin especialidad']
+                                 for m in medicos], dtype=np.int64)
+
+    ocupadas_medico = ocupadas.sum(axis=(1, 2))
+    capacidad_medico = capacidad.sum(axis=1) * dias
+
+    ocupadas_esp = np.bincount(especialidad_idx, weights=ocupadas_medico, minlength=len(especialidades))
+    capacidad_esp = np.bincount(especialidad_idx, weights=capacidad_medico, minlength=len(especialidades))
+
+    ocupadas_dia = ocupadas.sum(axis=(0, 2))
+    capacidad_dia = np.full(dias, capacidad.sum())
+
+    # Mapa de calor día de la semana x hora
+    fechas = np.arange(np.datetime64(desde, 'D'), np.datetime64(hasta, 'D') + 1)
+    dia_semana = (fechas.astype(np.int64) - 4) % 7  # 1970-01-01 fue jueves
+    ocupadas_dia_hora = ocupadas.sum(axis=0)
+    ocupadas_semana = np.zeros((7, 24), dtype=np.int64)
+    np.add.at(ocupadas_semana, dia_semana, ocupadas_dia_hora)
+    capacidad_semana = np.outer(np.bincount(dia_semana, minlength=7), capacidad.sum(axis=0))
+
+    por_medico = _ratio(ocupadas_medico, capacidad_medico)
+    por_especialidad = _ratio(ocupadas_esp, capacidad_esp)
+    por_dia = _ratio(ocupadas_dia, capacidad_dia)
+    mapa = _ratio(ocupadas_semana, capacidad_semana)
+    por_hora = _ratio(ocupadas_dia_hora.sum(axis=0), capacidad.sum(axis=0) * dias)
+
+    return {
+        'desde': desde.isoformat(),
+        'hasta': hasta.isoformat(),
+        'dias': dias,
+        'por_medico': [{
+            'medico_id': m['id'],
+            'nombre': m.get('name'),
+            'especialidad': m.get('especialidad'),
+            'citas': int(ocupadas_medico[i]),
+            'capacidad': int(capacidad_medico[i]),
+            'ocupacion': round(float(por_medico[i]), 4),
+        } for i, m in enumerate(medicos)],
+        'por_especialidad': [{
+            'especialidad': e,
+            'citas': int(ocupadas_esp[i]),
+            'capacidad': int(capacidad_esp[i]),
+            'ocupacion': round(float(por_especialidad[i]), 4),
+        } for i, e in enumerate(especialidades)],
+        'por_dia': [{
+            'fecha': str(fechas[i]),
+            'citas': int(ocupadas_dia[i]),
+            'ocupacion': round(float(por_dia[i]), 4),
+        } for i in range(dias)],
+        'por_hora': np.round(por_hora, 4).tolist(),
+        'mapa_calor': {
+            'dias_semana': DIAS_SEMANA,
+            'horas': list(range(24)),
+            'ocupacion': np.round(mapa, 4).tolist(),
+        },
+    }
@@ -1,95 +1,49 @@
-from typing import Dict, List
-from flask import Flask, render_template, request, jsonify, redirect, url_for, session, flash
-from flask_sqlalchemy import SQLAlchemy
-from flask_bcrypt import Bcrypt
-from flask_login import LoginManager, login_user, login_required, logout_user, current_user, UserMixin
+from typing import Dict, List, Optional
+import io
+import click
+from flask import Flask, Blueprint, Response, current_app, render_template, request, jsonify, redirect, url_for, flash
+from flask_login import login_user, login_required, logout_user, current_user
 from datetime import datetime, timedelta, date
 import os
-from functools import wraps
-import threading
+from sqlalchemy import select, update
+from sqlalchemy.exc import IntegrityError
 from werkzeug.security import generate_password_hash, check_password_hash
-from employees_service import EmployeesService  # Importar el nuevo servicio
+from werkzeug.middleware.proxy_fix import ProxyFix
+from config import config
+from extensions import db, bcrypt, login_manager, employees_service, appointment_lock
+from models import User, Especialidad, Cita, CitaArchivada
+from booking_queue import get_booking_queue
+from slot_holds import get_slot_holds
+from bulk_import import importar_citas, detectar_formato
+from analytics import ocupacion
+from availability_events import get_availability_broker, stream_events
+from maintenance import ejecutar_mantenimiento
+from change_feed import registrar_cambio, registrar_cambios, cambios_desde
+import rate_limit
+import db_routing
+from db_routing import read_only, consulta
+from appointment_series import FRECUENCIAS, generar_fechas, ocupados_en_rango, alternativas
+from doctor_schedule import horarios_del_medico
 import logging
 
-app = Flask(__name__)
-app.config['SECRET_KEY'] = 'tu_clave_secreta_muy_segura_aqui'
-app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///medical_system.db'
-app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
-app.config['NEST_API_URL'] = os.getenv('NEST_API_URL', 'http://localhost:3000')
-
-# Inicializar extensiones
-db = SQLAlchemy(app)
-bcrypt = Bcrypt(app)
-login_manager = LoginManager()
-login_manager.init_app(app)
-login_manager.login_view = 'login'
-
-# Inicializar servicio de empleados
-employees_service = EmployeesService(app.config['NEST_API_URL'])
-
-# Lock para operaciones concurrentes
-appointment_lock = threading.Lock()
-
-# Modelos actualizados
-class User(UserMixin, db.Model):
-    id = db.Column(db.Integer, primary_key=True)
-    email = db.Column(db.String(120), unique=True, nullable=False)
-    password_hash = db.Column(db.String(128), nullable=False)
-    nombre = db.Column(db.String(100), nullable=False)
-    telefono = db.Column(db.String(20))
-    fecha_nacimiento = db.Column(db.Date)
-    fecha_registro = db.Column(db.DateTime, default=datetime.utcnow)
-    is_active = db.Column(db.Boolean, default=True)
-    
-    # Relación con citas
-    citas = db.relationship('Cita', backref='paciente', lazy=True)
-
-class Especialidad(db.Model):
-    id = db.Column(db.Integer, primary_key=True)
-    nombre = db.Column(db.String(100), nullable=False, unique=True)
-    descripcion = db.Column(db.Text)
-
-class Cita(db.Model):
-    id = db.Column(db.Integer, primary_key=True)
-    paciente_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
-    medico_id = db.Column(db.String(50), nullable=False)  # Cambiar a String para IDs de NestJS
-    fecha_hora = db.Column(db.DateTime, nullable=False)
-    motivo = db.Column(db.Text)
-    estado = db.Column(db.String(20), default='programada')
-    fecha_creacion = db.Column(db.DateTime, default=datetime.utcnow)
-    notas = db.Column(db.Text)
-    
-    # Propiedades para obtener datos del médico desde NestJS
-    @property
-    def medico(self):
-        """Obtener datos del médico desde el servicio NestJS"""
-        return employees_service.get_doctor_by_id(self.medico_id)
-    
-    @property
-    def medico_nombre(self):
-        """Obtener nombre del médico"""
-        medico = self.medico
-        return medico.get('name', 'Médico no encontrado') if medico else 'Médico no encontrado'
-
-@login_manager.user_loader
-def load_user(user_id):
-    return User.query.get(int(user_id))
-
-# Decorador para limitar concurrencia
-def with_lock(func):
-    @wraps(func)
-    def wrapper(*args, **kwargs):
-        with appointment_lock:
-            return func(*args, **kwargs)
-    return wrapper
+bp = Blueprint('main', __name__)
+
+@bp.after_app_request
+def add_directory_age_header(response):
+    # Indicar la antigüedad del directorio de médicos usado para responder
+    service = current_app.extensions.get('employees_service')
+    age = service.directory_age() if service else None
+    if age is not None:
+        response.headers['X-Directorio-Edad'] = str(int(age))
+    return response
 
 # Rutas actualizadas
-@app.route('/')
+@bp.route('/')
 def index():
     especialidades = Especialidad.query.all()
     return render_template('index.html', especialidades=especialidades)
 
-@app.route('/register', methods=['GET', 'POST'])
+@bp.route('/register', methods=['GET', 'POST'])
 def register():
     if request.method == 'POST':
         data = request.get_json() or request.form
@@ -131,10 +85,10 @@ def register():
             login_user(user)
             
             if request.is_json:
-                return jsonify({'message': 'Usuario registrado exitosamente', 'redirect': url_for('dashboard')})
+                return jsonify({'message': 'Usuario registrado exitosamente', 'redirect': url_for('main.dashboard')})
             else:
                 flash('Usuario registrado exitosamente', 'success')
-                return redirect(url_for('dashboard'))
+                return redirect(url_for('main.dashboard'))
                 
         except Exception as e:
             db.session.rollback()
@@ -142,7 +96,7 @@ def register():
     
     return render_template('register.html')
 
-@app.route('/login', methods=['GET', 'POST'])
+@bp.route('/login', methods=['GET', 'POST'])
 def login():
     if request.method == 'POST':
         data = request.get_json() or request.form
@@ -154,9 +108,9 @@ def login():
         if user and check_password_hash(user.password_hash, password):
             login_user(user)
             if request.is_json:
-                return jsonify({'message': 'Login exitoso', 'redirect': url_for('dashboard')})
+                return jsonify({'message': 'Login exitoso', 'redirect': url_for('main.dashboard')})
             else:
-                return redirect(url_for('dashboard'))
+                return redirect(url_for('main.dashboard'))
         else:
             if request.is_json:
                 return jsonify({'error': 'Credenciales inválidas'}), 401
@@ -165,36 +119,38 @@ def login():
     
     return render_template('login.html')
 
-@app.route('/logout')
+@bp.route('/logout')
 @login_required
 def logout():
     logout_user()
-    return redirect(url_for('index'))
+    return redirect(url_for('main.index'))
 
-@app.route('/dashboard')
+@bp.route('/dashboard')
 @login_required
+@read_only
 def dashboard():
     # Obtener citas del usuario
-    citas = Cita.query.filter_by(paciente_id=current_user.id)\
+    citas = consulta(Cita).filter_by(paciente_id=current_user.id)\
                      .order_by(Cita.fecha_hora.desc()).limit(5).all()
     
     # Obtener especialidades para búsqueda rápida
-    especialidades = Especialidad.query.all()
+    especialidades = consulta(Especialidad).all()
     
     return render_template('dashboard.html', citas=citas, especialidades=especialidades)
 
-@app.route('/agendar-cita', methods=['GET'])
+@bp.route('/agendar-cita', methods=['GET'])
 @login_required
 def agendar_cita_form():
     min_date = date.today().isoformat()
-    return render_template('agendar_cita.html', min_date=min_date)
+    return render_template('agendar_cita.html', min_date=min_date,
+                           sse_habilitado=current_app.config['SSE_ENABLED'])
 
-@app.route('/mis-citas')
+@bp.route('/mis-citas')
 @login_required
 def mis_citas():
     return render_template('mis_citas.html')
 
-@app.route('/cancelar-cita/<int:cita_id>', methods=['POST'])
+@bp.route('/cancelar-cita/<int:cita_id>', methods=['POST'])
 @login_required
 def cancelar_cita(cita_id):
     cita = Cita.query.get_or_404(cita_id)
@@ -205,13 +161,22 @@ def cancelar_cita(cita_id):
     if cita.fecha_hora < datetime.now():
         return jsonify({'error': 'No se puede cancelar una cita pasada'}), 400
     
-    cita.estado = 'cancelada'
+    # Solo una cita programada se cancela (y se anuncia el horario como libre);
+    # la condición va en el UPDATE por si otra petición la cambió a la vez
+    resultado = db.session.execute(
+        update(Cita).where(Cita.id == cita.id, Cita.estado == 'programada').values(estado='cancelada')
+    )
+    if resultado.rowcount == 0:
+        db.session.rollback()
+        return jsonify({'error': 'Solo se pueden cancelar citas programadas'}), 400
+    registrar_cambio(cita, 'cancelada')
     db.session.commit()
     
     return jsonify({'message': 'Cita cancelada exitosamente'})
 
-@app.route('/buscar-medicos')
+@bp.route('/buscar-medicos')
 @login_required
+@read_only
 def buscar_medicos():
     especialidad = request.args.get('especialidad')
     fecha = request.args.get('fecha')
@@ -231,7 +196,7 @@ def buscar_medicos():
         try:
             fecha_obj = datetime.strptime(fecha, '%Y-%m-%d').date()
             for medico in medicos:
-                horarios_disponibles = get_horarios_disponibles_nest(medico, fecha_obj)
+                horarios_disponibles = get_horarios_disponibles_nest(medico, fecha_obj, current_user.id)
                 if horarios_disponibles:
                     medicos_disponibles.append({
                         'medico': medico,
@@ -242,7 +207,7 @@ def buscar_medicos():
     else:
         medicos_disponibles = [{'medico': m, 'horarios': []} for m in medicos]
     
-    especialidades = Especialidad.query.all()
+    especialidades = consulta(Especialidad).all()
     
     return render_template('buscar_medicos.html', 
                          medicos_disponibles=medicos_disponibles,
@@ -250,46 +215,38 @@ def buscar_medicos():
                          especialidad_seleccionada=especialidad,
                          fecha_seleccionada=fecha)
 
-def get_horarios_disponibles_nest(medico_data: Dict, fecha: date) -> List[str]:
-    """Obtener horarios disponibles para un médico usando datos de NestJS"""
+def get_horarios_disponibles_nest(medico_data: Dict, fecha: date,
+                                  paciente_id: Optional[int] = None) -> List[str]:
+    """Obtener horarios disponibles para un médico usando datos de NestJS
+
+    Los horarios retenidos temporalmente por otros pacientes no se ofrecen.
+    """
     if fecha < datetime.now().date():
         return []
     
     # Obtener citas existentes para ese día
-    citas_existentes = Cita.query.filter(
+    citas_existentes = consulta(Cita).filter(
         Cita.medico_id == medico_data['id'],
         db.func.date(Cita.fecha_hora) == fecha,
         Cita.estado == 'programada'
     ).all()
     
     # Generar horarios posibles usando datos de NestJS
-    horarios_ocupados = [cita.fecha_hora.time() for cita in citas_existentes]
-    horarios_disponibles = []
+    horarios_ocupados = {cita.fecha_hora.time() for cita in citas_existentes}
+    horarios_ocupados |= get_slot_holds().held_times(medico_data['id'], fecha, paciente_id)
     
     try:
-        # Parsear horarios del médico
-        horario_inicio = datetime.strptime(medico_data.get('horario_inicio', '08:00'), '%H:%M').time()
-        horario_fin = datetime.strptime(medico_data.get('horario_fin', '17:00'), '%H:%M').time()
-        duracion_cita = medico_data.get('duracion_cita', 30)
-        
-        hora_actual = horario_inicio
-        while hora_actual < horario_fin:
-            if hora_actual not in horarios_ocupados:
-                horarios_disponibles.append(hora_actual.strftime('%H:%M'))
-            
-            # Incrementar por duración de cita
-            tiempo_actual = datetime.combine(fecha, hora_actual)
-            tiempo_siguiente = tiempo_actual + timedelta(minutes=duracion_cita)
-            hora_actual = tiempo_siguiente.time()
-    
-    except (ValueError, KeyError) as e:
+        # Rejilla de horarios del médico según los datos de NestJS
+        rejilla = horarios_del_medico(medico_data)
+    except (ValueError, TypeError) as e:
         logging.error(f"Error procesando horarios del médico {medico_data.get('id')}: {e}")
         return []
     
-    return horarios_disponibles
+    return [hora.strftime('%H:%M') for hora in rejilla if hora not in horarios_ocupados]
 
-@app.route('/buscar-horarios')
+@bp.route('/buscar-horarios')
 @login_required
+@read_only
 def buscar_horarios():
     medico_id = request.args.get('medico_id')
     fecha_str = request.args.get('fecha')
@@ -304,15 +261,91 @@ def buscar_horarios():
         if not medico_data:
             return jsonify({'horarios': []})
 
-        horarios = get_horarios_disponibles_nest(medico_data, fecha)
+        horarios = get_horarios_disponibles_nest(medico_data, fecha, current_user.id)
         return jsonify({'horarios': horarios})
     except Exception as e:
         logging.error(f"Error buscando horarios: {e}")
         return jsonify({'horarios': []})
 
-@app.route('/agendar-cita', methods=['POST'])
+@bp.route('/retener-horario', methods=['POST'])
+@login_required
+def retener_horario():
+    """Retener un horario unos minutos mientras el paciente completa la reserva"""
+    data = request.get_json() or request.form
+    medico_id = data.get('medico_id')
+    fecha = data.get('fecha')
+    hora = data.get('hora')
+
+    if not all([medico_id, fecha, hora]):
+        return jsonify({'error': 'Debe indicar médico, fecha y hora'}), 400
+
+    try:
+        fecha_hora = datetime.strptime(f"{fecha} {hora}", '%Y-%m-%d %H:%M')
+    except ValueError:
+        return jsonify({'error': 'El formato de fecha u hora es inválido.'}), 400
+
+    if fecha_hora < datetime.now():
+        return jsonify({'error': 'No se puede retener un horario en el pasado'}), 400
+
+    medico_data = employees_service.get_doctor_by_id(medico_id)
+    if not medico_data or not medico_data.get('activo', False):
+        return jsonify({'error': f'El médico con ID {medico_id} no está disponible.'}), 404
+
+    ocupado = Cita.query.filter(
+        Cita.medico_id == medico_id,
+        Cita.fecha_hora == fecha_hora,
+        Cita.estado == 'programada'
+    ).first()
+    if ocupado:
+        return jsonify({'error': f'El horario {hora} del {fecha} ya está ocupado.'}), 409
+
+    hold = get_slot_holds().hold(medico_id, fecha_hora, current_user.id)
+    if hold is None:
+        return jsonify({'error': f'El horario {hora} del {fecha} está reservado temporalmente por otro paciente.'}), 409
+
+    return jsonify({
+        'hold_id': hold['id'],
+        'medico_id': medico_id,
+        'fecha': fecha,
+        'hora': hora,
+        'expira': datetime.fromtimestamp(hold['expira']).isoformat(),
+        'segundos': current_app.config['SLOT_HOLD_TTL']
+    }), 201
+
+@bp.route('/retener-horario/<hold_id>', methods=['DELETE'])
+@login_required
+def liberar_horario(hold_id):
+    if not get_slot_holds().release(hold_id, current_user.id):
+        return jsonify({'error': 'Retención no encontrada'}), 404
+    return jsonify({'message': 'Horario liberado'})
+
+@bp.route('/eventos/horarios')
+@login_required
+def eventos_horarios():
+    """Flujo SSE con los horarios que se ocupan o liberan para un médico y una fecha"""
+    if not current_app.config['SSE_ENABLED']:
+        # Con workers de hilos cada flujo abierto ocuparía un hilo indefinidamente
+        return jsonify({'error': 'Las actualizaciones en vivo no están habilitadas'}), 404
+    medico_id = request.args.get('medico_id')
+    fecha_str = request.args.get('fecha')
+
+    try:
+        fecha = datetime.strptime(fecha_str or '', '%Y-%m-%d').date()
+    except ValueError:
+        return jsonify({'error': 'Debe indicar medico_id y una fecha YYYY-MM-DD'}), 400
+    if not medico_id:
+        return jsonify({'error': 'Debe indicar medico_id y una fecha YYYY-MM-DD'}), 400
+
+    broker = get_availability_broker()
+    suscripcion = broker.subscribe(medico_id, fecha.isoformat())
+    response = Response(stream_events(broker, suscripcion, current_app.config['SSE_HEARTBEAT']),
+                        mimetype='text/event-stream')
+    response.headers['Cache-Control'] = 'no-cache'
+    response.headers['X-Accel-Buffering'] = 'no'
+    return response
+
+@bp.route('/agendar-cita', methods=['POST'])
 @login_required
-@with_lock
 def agendar_cita():
     data = request.get_json() or request.form
 
@@ -346,16 +379,12 @@ def agendar_cita():
         if fecha_hora < datetime.now():
             return jsonify({'error': f'{current_user.nombre}: No puede agendar una cita en el pasado ({fecha} {hora}).'}), 400
 
-        # Verificar disponibilidad
-        cita_existente = Cita.query.filter(
-            Cita.medico_id == medico_id,
-            Cita.fecha_hora == fecha_hora,
-            Cita.estado == 'programada'
-        ).first()
-
-        if cita_existente:
+        # Respetar la retención temporal de otro paciente sobre este horario
+        slot_holds = get_slot_holds()
+        retenido_por = slot_holds.holder(medico_id, fecha_hora)
+        if retenido_por is not None and retenido_por != current_user.id:
             return jsonify({
-                'error': f'{current_user.nombre}: El horario {hora} del {fecha} ya está ocupado para el Dr./Dra. {medico_data.get("name", "desconocido")}.',
+                'error': f'{current_user.nombre}: El horario {hora} del {fecha} está reservado temporalmente por otro paciente.',
                 'detalle': {
                     'paciente': current_user.nombre,
                     'medico': medico_data.get('name'),
@@ -364,16 +393,38 @@ def agendar_cita():
                 }
             }), 409
 
-        # Crear nueva cita
-        nueva_cita = Cita(
-            paciente_id=current_user.id,
-            medico_id=medico_id,  # Ahora es String ID de NestJS
-            fecha_hora=fecha_hora,
-            motivo=motivo
-        )
+        # En modo cola la cita la confirma el escritor por lotes (y libera la retención)
+        if current_app.config['BOOKING_QUEUE_ENABLED']:
+            return encolar_cita(medico_data, fecha_hora, motivo, data.get('esperar'))
 
-        db.session.add(nueva_cita)
-        db.session.commit()
+        with appointment_lock:
+            # Verificar disponibilidad
+            cita_existente = Cita.query.filter(
+                Cita.medico_id == medico_id,
+                Cita.fecha_hora == fecha_hora,
+                Cita.estado == 'programada'
+            ).first()
+
+            if cita_existente:
+                return respuesta_horario_ocupado(medico_data, fecha, hora)
+
+            # Crear nueva cita
+            nueva_cita = Cita(
+                paciente_id=current_user.id,
+                medico_id=medico_id,  # Ahora es String ID de NestJS
+                fecha_hora=fecha_hora,
+                motivo=motivo
+            )
+
+            try:
+                db.session.add(nueva_cita)
+                registrar_cambio(nueva_cita, 'creada')
+                slot_holds.release_slot(medico_id, fecha_hora)
+                db.session.commit()
+            except IntegrityError:
+                # Otro worker confirmó el mismo horario entre la verificación y el commit
+                db.session.rollback()
+                return respuesta_horario_ocupado(medico_data, fecha, hora)
 
         return jsonify({
             'message': f'Cita agendada exitosamente para {current_user.nombre} con el Dr./Dra. {medico_data.get("name", "desconocido")} el {fecha} a las {hora}.',
@@ -385,7 +436,7 @@ def agendar_cita():
                 'hora': hora,
                 'motivo': motivo
             },
-            'redirect': url_for('mis_citas')
+            'redirect': url_for('main.mis_citas')
         })
 
     except Exception as e:
@@ -399,23 +450,197 @@ def agendar_cita():
             'hora': hora
         }), 500
 
-@app.route('/mis-citas-json')
+def respuesta_horario_ocupado(medico_data: Dict, fecha: str, hora: str):
+    return jsonify({
+        'error': f'{current_user.nombre}: El horario {hora} del {fecha} ya está ocupado para el Dr./Dra. {medico_data.get("name", "desconocido")}.',
+        'detalle': {
+            'paciente': current_user.nombre,
+            'medico': medico_data.get('name'),
+            'fecha': fecha,
+            'hora': hora
+        }
+    }), 409
+
+def encolar_cita(medico_data: Dict, fecha_hora: datetime, motivo: str, esperar=None):
+    """Encolar una solicitud ya validada; responde 202 salvo que el escritor termine antes del plazo"""
+    booking_queue = get_booking_queue()
+    ticket = booking_queue.submit(current_user.id, medico_data['id'], fecha_hora, motivo,
+                                  medico_data.get('name', 'desconocido'))
+    try:
+        esperar = min(float(esperar or 0), current_app.config['BOOKING_QUEUE_MAX_WAIT'])
+    except (TypeError, ValueError):
+        esperar = 0
+    return respuesta_reserva_en_cola(ticket, booking_queue.wait(ticket, esperar))
+
+def respuesta_reserva_en_cola(ticket: str, resultado: Dict):
+    """Traducir el estado de una reserva en cola a la respuesta HTTP correspondiente"""
+    estado = resultado['estado']
+    if estado == 'confirmada':
+        # La cita la confirmó el escritor de la cola: leer del primario a continuación
+        db_routing.marcar_escritura(resultado.get('procesada'))
+        return jsonify({
+            'message': f'{current_user.nombre}: {resultado["mensaje"]}',
+            'estado': estado,
+            'cita_id': resultado['cita_id'],
+            'redirect': url_for('main.mis_citas')
+        })
+    if estado == 'conflicto':
+        return jsonify({'error': f'{current_user.nombre}: {resultado["mensaje"]}', 'estado': estado}), 409
+    if estado == 'error':
+        return jsonify({
+            'error': f'{current_user.nombre}: Error interno al agendar la cita.',
+            'detalle': resultado.get('mensaje'),
+            'estado': estado
+        }), 500
+
+    status_url = url_for('main.estado_reserva', ticket=ticket)
+    response = jsonify({
+        'message': f'{current_user.nombre}: Su solicitud de cita está en cola.',
+        'estado': estado,
+        'ticket': ticket,
+        'status_url': status_url,
+        'en_cola': get_booking_queue().pending()
+    })
+    response.headers['Location'] = status_url
+    return response, 202
+
+@bp.route('/agendar-cita/estado/<ticket>')
+@login_required
+def estado_reserva(ticket):
+    resultado = get_booking_queue().status(ticket)
+    if not resultado or resultado['paciente_id'] != current_user.id:
+        return jsonify({'error': 'Solicitud de cita no encontrada'}), 404
+    return respuesta_reserva_en_cola(ticket, resultado)
+
+@bp.route('/agendar-serie', methods=['POST'])
+@login_required
+def agendar_serie():
+    """Agendar una serie de citas semanales o quincenales en una sola transacción"""
+    data = request.get_json() or request.form
+
+    medico_id = data.get('medico_id')
+    fecha = data.get('fecha')
+    hora = data.get('hora')
+    motivo = data.get('motivo', '')
+    frecuencia = data.get('frecuencia', 'semanal')
+    ocurrencias = data.get('ocurrencias')
+    hasta = data.get('hasta')
+    maximo = current_app.config['SERIES_MAX_OCCURRENCES']
+
+    if not all([medico_id, fecha, hora]):
+        return jsonify({'error': f'{current_user.nombre}: Debe indicar médico, fecha y hora de la primera cita.'}), 400
+    if frecuencia not in FRECUENCIAS:
+        return jsonify({'error': f'{current_user.nombre}: Frecuencia inválida, use {" o ".join(FRECUENCIAS)}.'}), 400
+    if not ocurrencias and not hasta:
+        return jsonify({'error': f'{current_user.nombre}: Debe indicar el número de ocurrencias o la fecha final.'}), 400
+
+    try:
+        inicio = datetime.strptime(f"{fecha} {hora}", '%Y-%m-%d %H:%M')
+        ocurrencias = int(ocurrencias) if ocurrencias else None
+        hasta = datetime.strptime(hasta, '%Y-%m-%d').date() if hasta else None
+    except (TypeError, ValueError):
+        return jsonify({'error': f'{current_user.nombre}: El formato de fecha, hora u ocurrencias es inválido.'}), 400
+
+    if inicio < datetime.now():
+        return jsonify({'error': f'{current_user.nombre}: No puede agendar una cita en el pasado ({fecha} {hora}).'}), 400
+    if ocurrencias is not None and not 1 <= ocurrencias <= maximo:
+        return jsonify({'error': f'{current_user.nombre}: Una serie puede tener entre 1 y {maximo} citas.'}), 400
+
+    # Validar el médico una sola vez para toda la serie
+    medico_data = employees_service.get_doctor_by_id(medico_id)
+    if not medico_data:
+        return jsonify({'error': f'{current_user.nombre}: El médico con ID {medico_id} no existe.'}), 404
+    if not medico_data.get('activo', False):
+        return jsonify({'error': f'{current_user.nombre}: El médico {medico_data.get("name", "desconocido")} no está activo.'}), 400
+
+    fechas = generar_fechas(inicio, frecuencia, ocurrencias, hasta, maximo)
+    if not fechas:
+        return jsonify({'error': f'{current_user.nombre}: La fecha final no puede ser anterior a la primera cita.'}), 400
+    slot_holds = get_slot_holds()
+
+    def conflictos_de_la_serie():
+        ocupados = ocupados_en_rango(medico_id, fechas)
+        retenidos = slot_holds.held_slots(medico_id, fechas, current_user.id)
+        conflictos = [f for f in fechas if f in ocupados or f in retenidos]
+        if not conflictos:
+            return None
+        rejilla = horarios_del_medico(medico_data)
+        return jsonify({
+            'error': f'{current_user.nombre}: {len(conflictos)} de {len(fechas)} citas de la serie '
+                     f'no están disponibles con el Dr./Dra. {medico_data.get("name", "desconocido")}.',
+            'ocurrencias': [{
+                'fecha': f.strftime('%Y-%m-%d'),
+                'hora': f.strftime('%H:%M'),
+                'disponible': f not in conflictos,
+                'alternativas': alternativas(
+                    f, rejilla, ocupados, slot_holds.held_times(medico_id, f.date(), current_user.id)
+                ) if f in conflictos else []
+            } for f in fechas]
+        }), 409
+
+    try:
+        with appointment_lock:
+            conflicto = conflictos_de_la_serie()
+            if conflicto:
+                return conflicto
+
+            citas = [Cita(paciente_id=current_user.id, medico_id=medico_id, fecha_hora=f, motivo=motivo)
+                     for f in fechas]
+            try:
+                db.session.add_all(citas)
+                db.session.flush()
+                registrar_cambios(citas, 'creada')
+                slot_holds.release_slots((medico_id, f) for f in fechas)
+                db.session.commit()
+            except IntegrityError:
+                # Otro worker ocupó alguno de los horarios mientras tanto: informar cuáles
+                db.session.rollback()
+                return conflictos_de_la_serie() or (jsonify({
+                    'error': f'{current_user.nombre}: Alguno de los horarios de la serie acaba de ocuparse, '
+                             f'intente de nuevo.'
+                }), 409)
+
+        return jsonify({
+            'message': f'Se agendaron {len(citas)} citas para {current_user.nombre} con el Dr./Dra. '
+                       f'{medico_data.get("name", "desconocido")} ({frecuencia}) desde el {fecha} a las {hora}.',
+            'citas': [{
+                'cita_id': cita.id,
+                'fecha': cita.fecha_hora.strftime('%Y-%m-%d'),
+                'hora': cita.fecha_hora.strftime('%H:%M')
+            } for cita in citas],
+            'redirect': url_for('main.mis_citas')
+        })
+
+    except Exception as e:
+        db.session.rollback()
+        return jsonify({
+            'error': f'{current_user.nombre}: Error interno al agendar la serie de citas.',
+            'detalle': str(e)
+        }), 500
+
+@bp.route('/mis-citas-json')
 @login_required
+@read_only
 def mis_citas_json():
     try:
-        app.logger.info(f"Obteniendo citas para usuario {current_user.id}")
+        current_app.logger.info(f"Obteniendo citas para usuario {current_user.id}")
         
         # Obtener las citas y loggear cantidad
-        citas = Cita.query.filter_by(paciente_id=current_user.id)\
+        citas = consulta(Cita).filter_by(paciente_id=current_user.id)\
                          .order_by(Cita.fecha_hora.desc()).all()
-        app.logger.info(f"Se encontraron {len(citas)} citas")
+        
+        # El archivo solo se consulta cuando se pide el historial
+        if request.args.get('historial') in ('1', 'true'):
+            archivadas = consulta(CitaArchivada).filter_by(paciente_id=current_user.id).all()
+            citas = sorted(citas + archivadas, key=lambda c: c.fecha_hora, reverse=True)
+        current_app.logger.info(f"Se encontraron {len(citas)} citas")
         
         citas_lista = []
         for cita in citas:
             try:
-                app.logger.debug(f"Procesando cita ID: {cita.id}")
+                current_app.logger.debug(f"Procesando cita ID: {cita.id}")
                 medico_data = employees_service.get_doctor_by_id(cita.medico_id)
-                # app.logger.debug(f"Datos del médico: {medico_data}")
+                # current_app.logger.debug(f"Datos del médico: {medico_data}")
                 
                 medico_nombre = medico_data.get('name', 'Médico no encontrado') if medico_data else 'Médico no encontrado'
                 
@@ -427,24 +652,24 @@ def mis_citas_json():
                     'estado': cita.estado or 'desconocido',
                 }
                 citas_lista.append(cita_dict)
-                # app.logger.debug(f"Cita procesada: {cita_dict}")
+                # current_app.logger.debug(f"Cita procesada: {cita_dict}")
                 
             except Exception as e:
-                app.logger.error(f"Error procesando cita {cita.id}: {str(e)}")
+                current_app.logger.error(f"Error procesando cita {cita.id}: {str(e)}")
                 continue
 
-        app.logger.info(f"Retornando {len(citas_lista)} citas procesadas")
+        current_app.logger.info(f"Retornando {len(citas_lista)} citas procesadas")
         return jsonify({'citas': citas_lista})
         
     except Exception as e:
-        app.logger.error(f"Error en mis-citas-json: {str(e)}")
+        current_app.logger.error(f"Error en mis-citas-json: {str(e)}")
         return jsonify({
             'error': 'Error al obtener las citas',
             'message': str(e)
         }), 500
 
 # API endpoints actualizados
-@app.route('/api/especialidades')
+@bp.route('/api/especialidades')
 def get_especialidades():
     try:
         # Obtener todos los doctores del servicio
@@ -453,21 +678,72 @@ def get_especialidades():
         especialidades = list({doc.get('especialidad') for doc in doctores if doc.get('especialidad')})
         return jsonify([{"nombre": esp} for esp in sorted(especialidades)])
     except Exception as e:
-        app.logger.error(f"Error al obtener especialidades: {e}")
+        current_app.logger.error(f"Error al obtener especialidades: {e}")
         return jsonify({"error": "Error al obtener especialidades"}), 500
 
-@app.route('/api/medicos/<especialidad>')
+@bp.route('/api/medicos/buscar')
+def buscar_medicos_typeahead():
+    """Autocompletado de médicos por nombre o especialidad: ?q=card&activo=1&especialidad=&limite="""
+    q = request.args.get('q', '')
+    activo = request.args.get('activo', '1')
+    activo = None if activo == 'todos' else activo in ('1', 'true')
+    try:
+        limite = min(max(int(request.args.get('limite', 10)), 1), 50)
+    except ValueError:
+        limite = 10
+    medicos = employees_service.search_doctors(q, activo, request.args.get('especialidad'), limite)
+    return jsonify([{
+        'id': m['id'],
+        'name': m.get('name'),
+        'especialidad': m.get('especialidad'),
+        'activo': m.get('activo', False)
+    } for m in medicos])
+
+@bp.route('/api/medicos/<especialidad>')
 def get_medicos_por_especialidad(especialidad):
     try:
         # Usar el método del servicio para obtener médicos por especialidad
         medicos = employees_service.get_doctors_by_specialty(especialidad)
         return jsonify(medicos)
     except Exception as e:
-        app.logger.error(f"Error al obtener médicos por especialidad {especialidad}: {e}")
+        current_app.logger.error(f"Error al obtener médicos por especialidad {especialidad}: {e}")
         return jsonify({"error": f"Error al obtener médicos de {especialidad}"}), 500
 
+@bp.route('/api/directorio/estado')
+def estado_directorio():
+    """Antigüedad y origen del directorio de médicos (NestJS o snapshot local)"""
+    return jsonify(employees_service.directory_status())
+
+@bp.route('/api/cambios')
+@login_required
+def get_cambios():
+    """
+    Registro de cambios de citas a partir de un cursor: ?desde=<seq>&limite=<n>[&medico_id=].
+    El consumidor guarda el 'cursor' devuelto y lo envía en la siguiente llamada.
+    """
+    try:
+        desde = int(request.args.get('desde', 0))
+        limite = min(int(request.args.get('limite', 100)), 1000)
+    except ValueError:
+        return jsonify({'error': "'desde' y 'limite' deben ser enteros"}), 400
+    return jsonify(cambios_desde(desde, max(limite, 1), request.args.get('medico_id')))
+
+def cancelar_programadas(*columnas):
+    """Cancelar toda cita programada con un único UPDATE ... RETURNING.
+
+    Solo las filas que devuelve el UPDATE (las que seguían programadas) se
+    anotan en el registro de cambios; 'columnas' añade datos a cada fila.
+    """
+    canceladas = db.session.execute(
+        update(Cita).where(Cita.estado == 'programada').values(estado='cancelada')
+        .returning(Cita.id, Cita.paciente_id, Cita.medico_id, Cita.fecha_hora, Cita.estado, *columnas),
+        execution_options={'synchronize_session': False}
+    ).mappings().all()
+    registrar_cambios(canceladas, 'cancelada')
+    return canceladas
+
 # Rutas de administración (mantener las del código original)
-@app.route('/admin/cancelar-todas-citas', methods=['POST'])
+@bp.route('/admin/cancelar-todas-citas', methods=['POST'])
 @login_required
 def cancelar_todas_las_citas():
     """
@@ -475,23 +751,19 @@ def cancelar_todas_las_citas():
     Solo debe ser accesible por administradores en un entorno real.
     """
     try:
-        # Obtener todas las citas programadas
-        citas_programadas = Cita.query.filter_by(estado='programada').all()
+        # Cancelar las citas programadas y registrar solo las que cambiaron
+        canceladas = cancelar_programadas()
         
-        if not citas_programadas:
+        if not canceladas:
+            db.session.rollback()
             return jsonify({
                 'message': 'No hay citas programadas para cancelar',
                 'citas_canceladas': 0
             }), 200
         
-        # Contar las citas antes de cancelar
-        total_citas = len(citas_programadas)
-        
-        # Cancelar todas las citas programadas
-        Cita.query.filter_by(estado='programada').update({'estado': 'cancelada'})
-        
         # Confirmar los cambios
         db.session.commit()
+        total_citas = len(canceladas)
         
         return jsonify({
             'message': f'Se han cancelado exitosamente {total_citas} citas programadas',
@@ -508,18 +780,19 @@ def cancelar_todas_las_citas():
             'timestamp': datetime.now().isoformat()
         }), 500
 
-@app.route('/admin/cancelar-todas-citas-confirmacion', methods=['GET'])
+@bp.route('/admin/cancelar-todas-citas-confirmacion', methods=['GET'])
 @login_required
+@read_only
 def cancelar_todas_citas_confirmacion():
     """
     Ruta GET para mostrar información sobre las citas que se cancelarían
     """
     try:
         # Contar citas programadas
-        total_citas = Cita.query.filter_by(estado='programada').count()
+        total_citas = consulta(Cita).filter_by(estado='programada').count()
         
         # Obtener información detallada de las citas
-        citas_info = db.session.query(
+        citas_info = consulta(
             Cita.id,
             User.nombre.label('paciente'),
             Cita.medico_id,
@@ -555,7 +828,7 @@ def cancelar_todas_citas_confirmacion():
             'detalle': str(e)
         }), 500
 
-@app.route('/admin/cancelar-todas-citas-seguro', methods=['POST'])
+@bp.route('/admin/cancelar-todas-citas-seguro', methods=['POST'])
 @login_required
 def cancelar_todas_citas_seguro():
     """
@@ -571,39 +844,35 @@ def cancelar_todas_citas_seguro():
         }), 400
     
     try:
-        # Obtener todas las citas programadas con información detallada
-        citas_programadas = db.session.query(Cita, User.nombre)\
-            .join(User, Cita.paciente_id == User.id)\
-            .filter(Cita.estado == 'programada').all()
+        # Cancelar las citas programadas con información detallada de cada una
+        paciente_nombre = select(User.nombre).where(User.id == Cita.paciente_id).scalar_subquery()
+        canceladas = cancelar_programadas(Cita.motivo, paciente_nombre.label('paciente_nombre'))
         
-        if not citas_programadas:
+        if not canceladas:
+            db.session.rollback()
             return jsonify({
                 'message': 'No hay citas programadas para cancelar',
                 'citas_canceladas': 0
             }), 200
         
-        total_citas = len(citas_programadas)
+        db.session.commit()
+        total_citas = len(canceladas)
         
         # Crear lista de citas canceladas para el log
         citas_canceladas_info = []
-        for cita_info in citas_programadas:
-            cita, paciente_nombre = cita_info
+        for cita in canceladas:
             # Obtener nombre del médico desde NestJS
-            medico_data = employees_service.get_doctor_by_id(cita.medico_id)
+            medico_data = employees_service.get_doctor_by_id(cita['medico_id'])
             medico_nombre = medico_data.get('name', 'Médico no encontrado') if medico_data else 'Médico no encontrado'
             
             citas_canceladas_info.append({
-                'id': cita.id,
-                'paciente': paciente_nombre,
+                'id': cita['id'],
+                'paciente': cita['paciente_nombre'],
                 'medico': medico_nombre,
-                'fecha_hora': cita.fecha_hora.strftime('%Y-%m-%d %H:%M'),
-                'motivo': cita.motivo
+                'fecha_hora': cita['fecha_hora'].strftime('%Y-%m-%d %H:%M'),
+                'motivo': cita['motivo']
             })
         
-        # Cancelar todas las citas programadas
-        Cita.query.filter_by(estado='programada').update({'estado': 'cancelada'})
-        db.session.commit()
-        
         return jsonify({
             'message': f'Se han cancelado exitosamente {total_citas} citas programadas',
             'citas_canceladas': total_citas,
@@ -620,27 +889,247 @@ def cancelar_todas_citas_seguro():
             'timestamp': datetime.now().isoformat()
         }), 500
 
-if __name__ == '__main__':
+@bp.route('/admin/importar-citas', methods=['POST'])
+@login_required
+def importar_citas_admin():
+    """
+    Importación masiva de citas desde CSV o NDJSON (archivo 'archivo' o cuerpo de la petición).
+    Columnas: medico_id, paciente_id o paciente_email, fecha_hora (o fecha y hora),
+    motivo, estado y notas opcionales.
+    """
+    archivo = request.files.get('archivo')
+    if archivo is not None:
+        stream, nombre, content_type = archivo.stream, archivo.filename, archivo.mimetype
+    else:
+        stream, nombre, content_type = request.stream, None, request.mimetype
+    formato = request.args.get('formato') or detectar_formato(nombre, content_type)
+    if formato not in ('csv', 'ndjson'):
+        return jsonify({'error': f'Formato no soportado: {formato}'}), 400
+
+    try:
+        reporte = importar_citas(io.TextIOWrapper(stream, encoding='utf-8-sig', newline=''),
+                                 formato, chunk_size=current_app.config['IMPORT_CHUNK_SIZE'])
+    except Exception as e:
+        return jsonify({
+            'error': 'Error interno al importar las citas',
+            'detalle': str(e),
+            'timestamp': datetime.now().isoformat()
+        }), 500
+
+    if 'interrumpida' in reporte:
+        # Los bloques hasta ultima_fila_confirmada quedaron guardados; reimportar
+        # el archivo es seguro porque las filas ya existentes salen como duplicadas
+        return jsonify({
+            'error': f'Importación interrumpida tras la fila {reporte["ultima_fila_confirmada"]}',
+            'detalle': reporte['interrumpida'],
+            **reporte,
+            'timestamp': datetime.now().isoformat()
+        }), 500
+
+    return jsonify({
+        'message': f'Se importaron {reporte["insertadas"]} de {reporte["total"]} citas',
+        **reporte,
+        'timestamp': datetime.now().isoformat()
+    }), 200
+
+@bp.route('/admin/analitica/ocupacion', methods=['GET'])
+@login_required
+def analitica_ocupacion():
+    """
+    Ocupación por médico, especialidad y día, y mapa de calor por hora, entre
+    'desde' y 'hasta' (YYYY-MM-DD, por defecto los últimos 30 días).
+    """
+    try:
+        hasta = datetime.strptime(request.args['hasta'], '%Y-%m-%d').date() \
+            if request.args.get('hasta') else date.today()
+        desde = datetime.strptime(request.args['desde'], '%Y-%m-%d').date() \
+            if request.args.get('desde') else hasta - timedelta(days=29)
+    except ValueError:
+        return jsonify({'error': 'Formato de fecha inválido, use YYYY-MM-DD'}), 400
+
+    if desde > hasta:
+        return jsonify({'error': "'desde' debe ser anterior o igual a 'hasta'"}), 400
+    if (hasta - desde).days > current_app.config['ANALYTICS_MAX_DAYS']:
+        return jsonify({'error': f'El rango máximo es de {current_app.config["ANALYTICS_MAX_DAYS"]} días'}), 400
+
+    especialidad = request.args.get('especialidad')
+    try:
+        if especialidad:
+            medicos = employees_service.get_doctors_by_specialty(especialidad)
+        else:
+            medicos = employees_service.get_all_doctors()
+        return jsonify(ocupacion(medicos, desde, hasta)), 200
+    except Exception as e:
+        return jsonify({
+            'error': 'Error al calcular la ocupación',
+            'detalle': str(e)
+        }), 500
+
+@bp.route('/admin/mantenimiento', methods=['POST'])
+@login_required
+def mantenimiento_admin():
+    """
+    Ejecutar a demanda el mantenimiento: completar citas vencidas y archivar las antiguas.
+    """
+    try:
+        resultado = ejecutar_mantenimiento(current_app.config['MAINTENANCE_ARCHIVE_DAYS'],
+                                           current_app.config['MAINTENANCE_BATCH_SIZE'],
+                                           current_app.config['CHANGE_FEED_RETENTION_DAYS'])
+        return jsonify({
+            'message': f'{resultado["completadas"]} citas completadas y {resultado["archivadas"]} archivadas',
+            **resultado
+        }), 200
+    except Exception as e:
+        db.session.rollback()
+        return jsonify({
+            'error': 'Error interno en el mantenimiento de citas',
+            'detalle': str(e),
+            'timestamp': datetime.now().isoformat()
+        }), 500
+
+def _migrar_autoincrement_cita():
+    """Reconstruir en SQLite la tabla cita creada sin AUTOINCREMENT.
+
+    Sin AUTOINCREMENT SQLite reutiliza max(id) + 1, y tras archivar las citas
+    de id más alto una cita nueva recibiría el id de una ya archivada. La
+    secuencia se deja por encima de todo id usado en cita, cita_archivada y
+    cambio_cita.
+    """
+    if db.engine.url.get_backend_name() != 'sqlite':
+        return
+    with db.engine.connect() as conn:
+        sql = conn.exec_driver_sql("SELECT sql FROM sqlite_master WHERE type = 'table' AND name = 'cita'").scalar()
+        if sql is None or 'AUTOINCREMENT' in sql.upper():
+            return
+        conn.exec_driver_sql('BEGIN IMMEDIATE')
+        for index in Cita.__table__.indexes:
+            index.drop(conn, checkfirst=True)
+        conn.exec_driver_sql('ALTER TABLE cita RENAME TO cita_sin_autoincrement')
+        Cita.__table__.create(conn)
+        columnas = ', '.join(c.name for c in Cita.__table__.columns)
+        conn.exec_driver_sql(f'INSERT INTO cita ({columnas}) SELECT {columnas} FROM cita_sin_autoincrement')
+        conn.exec_driver_sql('DROP TABLE cita_sin_autoincrement')
+        conn.exec_driver_sql("DELETE FROM sqlite_sequence WHERE name = 'cita'")
+        conn.exec_driver_sql(
+            "INSERT INTO sqlite_sequence (name, seq) SELECT 'cita', max("
+            "(SELECT coalesce(max(id), 0) FROM cita), "
+            "(SELECT coalesce(max(id), 0) FROM cita_archivada), "
+            "(SELECT coalesce(max(cita_id), 0) FROM cambio_cita))"
+        )
+        conn.commit()
+
+def init_db():
+    """Crear las tablas y sembrar las especialidades si no existen"""
     # No necesitamos init_db para médicos ya que vienen de NestJS
-    with app.app_context():
-        db.create_all()
+    db.create_all()
+    _migrar_autoincrement_cita()
+    # create_all no añade índices nuevos a tablas que ya existían
+    for index in Cita.__table__.indexes:
+        index.create(db.engine, checkfirst=True)
+    
+    # Crear especialidades si no existen
+    if not Especialidad.query.first():
+        especialidades = [
+            Especialidad(nombre='Medicina General', descripcion='Atención médica general'),
+            Especialidad(nombre='Cardiología', descripcion='Especialista en corazón'),
+            Especialidad(nombre='Dermatología', descripcion='Especialista en piel'),
+            Especialidad(nombre='Neurología', descripcion='Especialista en sistema nervioso'),
+            Especialidad(nombre='Pediatría', descripcion='Especialista en niños'),
+            Especialidad(nombre='Ginecología', descripcion='Especialista en salud femenina'),
+            Especialidad(nombre='Ortopedia', descripcion='Especialista en huesos y articulaciones'),
+            Especialidad(nombre='Psicología', descripcion='Especialista en salud mental')
+        ]
         
-        # Crear especialidades si no existen
-        if not Especialidad.query.first():
-            especialidades = [
-                Especialidad(nombre='Medicina General', descripcion='Atención médica general'),
-                Especialidad(nombre='Cardiología', descripcion='Especialista en corazón'),
-                Especialidad(nombre='Dermatología', descripcion='Especialista en piel'),
-                Especialidad(nombre='Neurología', descripcion='Especialista en sistema nervioso'),
-                Especialidad(nombre='Pediatría', descripcion='Especialista en niños'),
-                Especialidad(nombre='Ginecología', descripcion='Especialista en salud femenina'),
-                Especialidad(nombre='Ortopedia', descripcion='Especialista en huesos y articulaciones'),
-                Especialidad(nombre='Psicología', descripcion='Especialista en salud mental')
-            ]
-            
-            for esp in especialidades:
-                db.session.add(esp)
-            db.session.commit()
-            print("Base de datos inicializada")
+        for esp in especialidades:
+            db.session.add(esp)
+        db.session.commit()
+
+@click.command('init-db')
+def init_db_command():
+    """Crear las tablas y sembrar datos iniciales: flask --app app init-db"""
+    init_db()
+    click.echo("Base de datos inicializada")
+
+@click.command('importar-citas')
+@click.argument('archivo', type=click.File('r', encoding='utf-8-sig'))
+@click.option('--formato', type=click.Choice(['csv', 'ndjson']), default=None,
+              help='Por defecto se deduce de la extensión del archivo')
+@click.option('--bloque', default=5000, show_default=True, help='Filas por transacción')
+def importar_citas_command(archivo, formato, bloque):
+    """Importar citas masivamente desde CSV o NDJSON: flask --app app importar-citas citas.csv"""
+    formato = formato or detectar_formato(archivo.name)
+    reporte = importar_citas(archivo, formato, chunk_size=bloque)
+    for fila in reporte['filas']:
+        click.echo(f"Fila {fila['fila']}: {fila['estado']} - {fila['motivo']}", err=True)
+    click.echo(f"{reporte['insertadas']} de {reporte['total']} citas importadas "
+               f"({reporte['conflictos']} conflictos, {reporte['duplicadas']} duplicadas, "
+               f"{reporte['errores']} errores)")
+    if 'interrumpida' in reporte:
+        raise click.ClickException(f"Importación interrumpida tras la fila "
+                                   f"{reporte['ultima_fila_confirmada']}: {reporte['interrumpida']}")
+
+@click.command('mantenimiento')
+@click.option('--dias', default=None, type=int, help='Antigüedad mínima para archivar (MAINTENANCE_ARCHIVE_DAYS)')
+@click.option('--lote', default=None, type=int, help='Filas por transacción (MAINTENANCE_BATCH_SIZE)')
+def mantenimiento_command(dias, lote):
+    """Completar citas vencidas y archivar las antiguas.
+
+    Pensado para ejecutarse periódicamente, por ejemplo desde cron:
+    */15 * * * * flask --app app mantenimiento
+    """
+    resultado = ejecutar_mantenimiento(dias or current_app.config['MAINTENANCE_ARCHIVE_DAYS'],
+                                       lote or current_app.config['MAINTENANCE_BATCH_SIZE'],
+                                       current_app.config['CHANGE_FEED_RETENTION_DAYS'])
+    click.echo(f"{resultado['completadas']} citas completadas, {resultado['archivadas']} archivadas")
+
+def init_worker(app: Flask):
+    """Preparar un worker recién creado con fork (gunicorn post_fork)
+
+    Las conexiones abiertas en el proceso maestro no deben compartirse entre
+    procesos, y los hilos de refresco del directorio no sobreviven al fork.
+    """
+    with app.app_context():
+        db.engine.dispose(close=False)
+        db_routing.dispose(app)
+        service = app.extensions.get('employees_service')
+        if service is not None:
+            service.after_fork()
+        # Los hilos escritor de la cola y lector de cambios no se heredan; se recrean en el primer uso
+        app.extensions.pop('booking_queue', None)
+        app.extensions.pop('availability_broker', None)
+        app.extensions['admission_control'].reset_after_fork()
+        if app.config['BOOKING_QUEUE_ENABLED']:
+            # Arrancar ya el escritor: las solicitudes que dejó pendientes un
+            # worker reiniciado se procesan aunque nadie consulte su estado
+            get_booking_queue()
+
+def create_app(config_name: Optional[str] = None) -> Flask:
+    """Fábrica de la aplicación: config_name es development, production o testing"""
+    config_name = config_name or os.getenv('FLASK_CONFIG', 'default')
+
+    app = Flask(__name__)
+    app.config.from_object(config[config_name])
+    if app.config['PROXY_FIX_X_FOR']:
+        # request.remote_addr pasa a ser la IP del cliente que informa el proxy
+        app.wsgi_app = ProxyFix(app.wsgi_app, x_for=app.config['PROXY_FIX_X_FOR'])
+
+    # Inicializar extensiones
+    db.init_app(app)
+    bcrypt.init_app(app)
+    login_manager.init_app(app)
+
+    app.register_blueprint(bp)
+    rate_limit.init_app(app)
+    db_routing.init_app(app)
+    app.cli.add_command(init_db_command)
+    app.cli.add_command(importar_citas_command)
+    app.cli.add_command(mantenimiento_command)
+
+    return app
+
+if __name__ == '__main__':
+    app = create_app('development')
+    with app.app_context():
+        init_db()
     
-    app.run(debug=True, host='0.0.0.0', port=5000, threaded=True)
+    app.run(host='0.0.0.0', port=5000, threaded=True)
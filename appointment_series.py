@@ -0,0 +1,43 @@
+from datetime import date, datetime, time, timedelta
+from typing import AbstractSet, List, Optional, Set
+from extensions import db
+from models import Cita
+
+FRECUENCIAS = {'semanal': 7, 'quincenal': 14}
+
+def generar_fechas(inicio: datetime, frecuencia: str, ocurrencias: Optional[int] = None,
+                   hasta: Optional[date] = None, maximo: int = 52) -> List[datetime]:
+    """Fechas de una serie semanal o quincenal, por número de ocurrencias o hasta una fecha"""
+    paso = timedelta(days=FRECUENCIAS[frecuencia])
+    fechas = []
+    actual = inicio
+    while len(fechas) < maximo:
+        if ocurrencias is not None and len(fechas) >= ocurrencias:
+            break
+        if hasta is not None and actual.date() > hasta:
+            break
+        fechas.append(actual)
+        actual += paso
+    return fechas
+
+def ocupados_en_rango(medico_id: str, fechas: List[datetime]) -> Set[datetime]:
+    """Horarios programados del médico entre el primer y el último día de la serie (una consulta)"""
+    desde = datetime.combine(fechas[0].date(), time.min)
+    hasta = datetime.combine(fechas[-1].date() + timedelta(days=1), time.min)
+    return {fecha_hora for (fecha_hora,) in db.session.query(Cita.fecha_hora).filter(
+        Cita.medico_id == medico_id,
+        Cita.estado == 'programada',
+        Cita.fecha_hora >= desde,
+        Cita.fecha_hora < hasta
+    )}
+
+def alternativas(fecha_hora: datetime, rejilla: List[time], ocupados: Set[datetime],
+                 retenidas: AbstractSet[time] = frozenset(), cantidad: int = 3) -> List[str]:
+    """Horarios libres del mismo día más cercanos al solicitado.
+
+    'retenidas' son las horas de ese día que otros pacientes retienen (held_times).
+    """
+    libres = [datetime.combine(fecha_hora.date(), h) for h in rejilla if h not in retenidas]
+    libres = [f for f in libres if f not in ocupados and f > datetime.now()]
+    libres.sort(key=lambda f: abs(f - fecha_hora))
+    return sorted(f.strftime('%H:%M') for f in libres[:cantidad])
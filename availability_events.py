@@ -0,0 +1,154 @@
+import json
+import logging
+import threading
+import time
+from collections import deque
+from datetime import datetime
+from typing import Dict, Iterator, List, Optional, Set, Tuple
+from flask import Flask, current_app
+from sqlalchemy import func, select
+from extensions import db
+from models import CambioCita
+from change_feed import cambios_desde
+
+Clave = Tuple[str, str]  # (medico_id, fecha YYYY-MM-DD)
+
+class Suscripcion:
+    """Buzón de eventos de un cliente SSE suscrito a un médico y una fecha"""
+
+    def __init__(self, clave: Clave, max_pendientes: int):
+        self.clave = clave
+        self._eventos = deque(maxlen=max_pendientes)
+        self._desbordada = False
+        self._hay_eventos = threading.Event()
+
+    def entregar(self, evento: Dict) -> None:
+        if len(self._eventos) == self._eventos.maxlen:
+            # Cliente lento: en lugar de crecer sin límite se le pide recargar
+            self._desbordada = True
+        self._eventos.append(evento)
+        self._hay_eventos.set()
+
+    def esperar(self, timeout: float) -> List[Dict]:
+        """Eventos pendientes; lista vacía si no llegó nada en timeout segundos"""
+        if not self._hay_eventos.wait(timeout):
+            return []
+        self._hay_eventos.clear()
+        if self._desbordada:
+            self._desbordada = False
+            self._eventos.clear()
+            return [{'tipo': 'recargar'}]
+        eventos = []
+        while self._eventos:
+            eventos.append(self._eventos.popleft())
+        return eventos
+
+# Tipo de cambio de cita -> evento de disponibilidad
+EVENTOS = {'creada': 'ocupado', 'cancelada': 'liberado'}
+
+class AvailabilityBroker:
+    """Difusión de cambios de disponibilidad a los suscriptores de cada médico y fecha.
+
+    Los suscriptores se indexan por (médico, fecha), así que publicar un cambio
+    solo toca a quienes miran ese día; un suscriptor inactivo no consume nada
+    más que su entrada en el índice y su buzón vacío.
+
+    Las reservas y cancelaciones pueden confirmarse en cualquier worker, así
+    que los eventos no se publican desde las rutas: mientras haya suscriptores,
+    un hilo por proceso lee el registro de cambios (cambio_cita) a partir de
+    su cursor y lo difunde a los suscriptores locales.
+    """
+
+    def __init__(self, app: Optional[Flask] = None, max_pendientes: int = 100, intervalo: float = 1.0):
+        self.app = app
+        self.max_pendientes = max_pendientes
+        self.intervalo = intervalo
+        self._suscriptores: Dict[Clave, Set[Suscripcion]] = {}
+        self._cursor: Optional[int] = None
+        self._lector: Optional[threading.Thread] = None
+        self._lock = threading.Lock()
+
+    def subscribe(self, medico_id: str, fecha: str) -> Suscripcion:
+        suscripcion = Suscripcion((medico_id, fecha), self.max_pendientes)
+        with self._lock:
+            if self._cursor is None:
+                # Primer suscriptor: difundir solo los cambios posteriores a este momento
+                self._cursor = db.session.execute(select(func.max(CambioCita.seq))).scalar() or 0
+            self._suscriptores.setdefault(suscripcion.clave, set()).add(suscripcion)
+            if self.app is not None and (self._lector is None or not self._lector.is_alive()):
+                self._lector = threading.Thread(target=self._leer_cambios, name='availability-feed', daemon=True)
+                self._lector.start()
+        return suscripcion
+
+    def unsubscribe(self, suscripcion: Suscripcion) -> None:
+        with self._lock:
+            suscriptores = self._suscriptores.get(suscripcion.clave)
+            if suscriptores is not None:
+                suscriptores.discard(suscripcion)
+                if not suscriptores:
+                    del self._suscriptores[suscripcion.clave]
+            if not self._suscriptores:
+                # Sin suscriptores no se lee el registro; el próximo empieza desde el final
+                self._cursor = None
+
+    def _leer_cambios(self) -> None:
+        while True:
+            time.sleep(self.intervalo)
+            try:
+                with self.app.app_context():
+                    while self.poll():
+                        pass
+            except Exception as e:
+                logging.error(f"Error leyendo el registro de cambios para SSE: {e}")
+
+    def poll(self, limite: int = 500) -> bool:
+        """Difundir los cambios nuevos del registro; True si quedan más por leer"""
+        with self._lock:
+            cursor = self._cursor
+        if cursor is None:
+            return False
+        datos = cambios_desde(cursor, limite)
+        for cambio in datos['cambios']:
+            tipo = EVENTOS.get(cambio['tipo'])
+            if tipo is None or (tipo == 'ocupado' and cambio['estado'] != 'programada'):
+                continue
+            self.publish(cambio['medico_id'], datetime.fromisoformat(cambio['fecha_hora']), tipo)
+        with self._lock:
+            if self._cursor is not None:
+                self._cursor = datos['cursor']
+        return datos['hay_mas']
+
+    def publish(self, medico_id: str, fecha_hora: datetime, tipo: str) -> None:
+        """Notificar que un horario quedó 'ocupado' o 'liberado'"""
+        clave = (medico_id, fecha_hora.date().isoformat())
+        with self._lock:
+            suscriptores = list(self._suscriptores.get(clave, ()))
+        if not suscriptores:
+            return
+        evento = {'tipo': tipo, 'medico_id': medico_id, 'hora': fecha_hora.strftime('%H:%M')}
+        for suscripcion in suscriptores:
+            suscripcion.entregar(evento)
+
+def stream_events(broker: AvailabilityBroker, suscripcion: Suscripcion,
+                  heartbeat: float = 15.0) -> Iterator[str]:
+    """Generador de mensajes SSE; al cerrarse la conexión se cancela la suscripción"""
+    try:
+        yield 'retry: 3000\n\n'
+        while True:
+            eventos = suscripcion.esperar(heartbeat)
+            if not eventos:
+                # Comentario SSE para mantener viva la conexión a través de proxies
+                yield ': ping\n\n'
+                continue
+            for evento in eventos:
+                yield f"event: {evento['tipo']}\ndata: {json.dumps(evento)}\n\n"
+    finally:
+        broker.unsubscribe(suscripcion)
+
+def get_availability_broker() -> AvailabilityBroker:
+    """Difusor de disponibilidad de la aplicación actual"""
+    broker = current_app.extensions.get('availability_broker')
+    if broker is None:
+        broker = current_app.extensions.setdefault('availability_broker', AvailabilityBroker(
+            current_app._get_current_object(), intervalo=current_app.config['SSE_POLL_INTERVAL']))
+    return broker
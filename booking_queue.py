@@ -0,0 +1,280 @@
+import logging
+import threading
+import time
+import uuid
+from typing import Dict, List, Optional
+from flask import Flask, current_app
+from sqlalchemy import delete, func, or_, select, update
+from sqlalchemy.exc import IntegrityError
+from extensions import db, appointment_lock
+from models import Cita, CerrojoEscritor, SolicitudCita
+from change_feed import registrar_cambios
+from slot_holds import get_slot_holds
+
+class BookingQueue:
+    """Cola de reservas con un único escritor que confirma las citas por lotes.
+
+    Las solicitudes ya validadas se guardan en la tabla solicitud_cita, así
+    que cualquier worker puede encolar o responder una consulta de estado y
+    un reinicio no pierde las solicitudes aceptadas. Cada worker tiene un hilo
+    escritor, pero solo trabaja el que tiene la concesión de cerrojo_escritor;
+    si ese worker muere, otro la toma cuando vence. El escritor agrupa las
+    pendientes en lotes y las inserta en una sola transacción, resolviendo los
+    conflictos de cada solicitud en orden FIFO.
+    """
+
+    CERROJO = 'reservas'
+    PURGA_CADA = 60.0
+
+    def __init__(self, app: Flask, batch_size: int = 100, intervalo: float = 0.05,
+                 result_ttl: int = 600, max_attempts: int = 3, concesion: float = 10.0):
+        self.app = app
+        self.batch_size = batch_size
+        self.intervalo = intervalo
+        self.result_ttl = result_ttl
+        self.max_attempts = max_attempts
+        self.concesion = concesion
+        self._id = uuid.uuid4().hex
+        self._lider_hasta = 0.0
+        self._proximo_intento = 0.0
+        self._proxima_purga = 0.0
+        self._thread: Optional[threading.Thread] = None
+
+    def start(self) -> None:
+        self._thread = threading.Thread(target=self._run, name='booking-writer', daemon=True)
+        self._thread.start()
+
+    def submit(self, paciente_id: int, medico_id: str, fecha_hora, motivo: str,
+               medico_nombre: str) -> str:
+        """Encolar una solicitud de cita y devolver su ticket"""
+        ticket = uuid.uuid4().hex
+        db.session.add(SolicitudCita(
+            ticket=ticket,
+            paciente_id=paciente_id,
+            medico_id=medico_id,
+            medico_nombre=medico_nombre,
+            fecha_hora=fecha_hora,
+            motivo=motivo,
+            encolada=time.time(),
+        ))
+        db.session.commit()
+        return ticket
+
+    def status(self, ticket: str) -> Optional[Dict]:
+        """Estado actual de una solicitud, o None si el ticket no existe o expiró"""
+        solicitud = db.session.execute(
+            select(SolicitudCita).where(SolicitudCita.ticket == ticket)
+        ).scalar_one_or_none()
+        if solicitud is None:
+            return None
+        return {
+            'estado': solicitud.estado,
+            'paciente_id': solicitud.paciente_id,
+            'cita_id': solicitud.cita_id,
+            'mensaje': solicitud.mensaje,
+            'encolada': solicitud.encolada,
+            'procesada': solicitud.procesada,
+        }
+
+    def wait(self, ticket: str, timeout: float) -> Optional[Dict]:
+        """Esperar como máximo timeout segundos a que se procese la solicitud"""
+        deadline = time.monotonic() + timeout
+        result = self.status(ticket)
+        while result is not None and result['estado'] == 'pendiente' and time.monotonic() < deadline:
+            db.session.rollback()  # terminar la transacción de lectura para ver el commit del escritor
+            time.sleep(self.intervalo)
+            result = self.status(ticket)
+        return result
+
+    def pending(self) -> int:
+        return db.session.execute(
+            select(func.count()).select_from(SolicitudCita).where(SolicitudCita.estado == 'pendiente')
+        ).scalar()
+
+    def _adquirir(self) -> bool:
+        """Tomar o renovar la concesión de escritor; True si este proceso es el escritor"""
+        ahora = time.time()
+        if ahora < self._lider_hasta - self.concesion / 2:
+            return True
+        if self._lider_hasta <= ahora and ahora < self._proximo_intento:
+            return False
+        self._proximo_intento = ahora + self.concesion / 2
+        resultado = db.session.execute(
+            update(CerrojoEscritor)
+            .where(CerrojoEscritor.nombre == self.CERROJO,
+                   or_(CerrojoEscritor.dueno == self._id, CerrojoEscritor.expira < ahora))
+            .values(dueno=self._id, expira=ahora + self.concesion)
+        )
+        try:
+            if resultado.rowcount == 0 and db.session.get(CerrojoEscritor, self.CERROJO) is None:
+                db.session.add(CerrojoEscritor(nombre=self.CERROJO, dueno=self._id, expira=ahora + self.concesion))
+            elif resultado.rowcount == 0:
+                db.session.rollback()
+                self._lider_hasta = 0.0
+                return False
+            db.session.commit()
+        except IntegrityError:
+            # Otro worker creó la concesión a la vez
+            db.session.rollback()
+            self._lider_hasta = 0.0
+            return False
+        self._lider_hasta = ahora + self.concesion
+        return True
+
+    def _run(self) -> None:
+        while True:
+            try:
+                with self.app.app_context():
+                    procesadas = self.process_pending()
+            except Exception as e:
+                logging.error(f"Error en el escritor de la cola de reservas: {e}")
+                procesadas = 0
+            if not procesadas:
+                time.sleep(self.intervalo)
+
+    def process_pending(self) -> int:
+        """Procesar un lote de solicitudes pendientes si este proceso es el escritor"""
+        if not self._adquirir():
+            return 0
+        batch = db.session.execute(
+            select(SolicitudCita).where(SolicitudCita.estado == 'pendiente')
+            .order_by(SolicitudCita.id).limit(self.batch_size)
+        ).scalars().all()
+        if not batch:
+            db.session.rollback()
+            self._purgar()
+            return 0
+        try:
+            self._process(batch)
+        except Exception as e:
+            logging.error(f"Error procesando lote de {len(batch)} reservas: {e}")
+            db.session.rollback()
+            if self._renovar_en_transaccion():
+                self._guardar_resultados({s.id: {'estado': 'error', 'mensaje': str(e)} for s in batch})
+            db.session.commit()
+        return len(batch)
+
+    def _process(self, batch: List[SolicitudCita]) -> None:
+        """Insertar un lote en una sola transacción con resolución de conflictos por solicitud"""
+        for intento in range(self.max_attempts):
+            try:
+                return self._insert_batch(batch)
+            except IntegrityError:
+                # Otro proceso confirmó alguno de estos horarios entre la consulta y el
+                # commit; al repetir, la consulta de ocupados ya lo ve como conflicto
+                if intento == self.max_attempts - 1:
+                    raise
+
+    def _renovar_en_transaccion(self) -> bool:
+        # Primera escritura de la transacción: si la concesión ya es de otro
+        # escritor este lote no se confirma (evita procesar dos veces)
+        ahora = time.time()
+        resultado = db.session.execute(
+            update(CerrojoEscritor)
+            .where(CerrojoEscritor.nombre == self.CERROJO, CerrojoEscritor.dueno == self._id)
+            .values(expira=ahora + self.concesion)
+        )
+        if resultado.rowcount == 0:
+            self._lider_hasta = 0.0
+            return False
+        self._lider_hasta = ahora + self.concesion
+        return True
+
+    def _insert_batch(self, batch: List[SolicitudCita]) -> None:
+        items = [{
+            'id': s.id,
+            'paciente_id': s.paciente_id,
+            'medico_id': s.medico_id,
+            'medico_nombre': s.medico_nombre,
+            'fecha_hora': s.fecha_hora,
+            'motivo': s.motivo,
+        } for s in batch]
+        results: Dict[int, Dict] = {}
+        with appointment_lock:
+            try:
+                if not self._renovar_en_transaccion():
+                    db.session.rollback()
+                    return
+                medico_ids = {item['medico_id'] for item in items}
+                fechas = {item['fecha_hora'] for item in items}
+                # Una sola consulta para todos los horarios del lote
+                ocupados = {
+                    (medico_id, fecha_hora) for medico_id, fecha_hora in db.session.query(
+                        Cita.medico_id, Cita.fecha_hora
+                    ).filter(
+                        Cita.medico_id.in_(medico_ids),
+                        Cita.fecha_hora.in_(fechas),
+                        Cita.estado == 'programada'
+                    )
+                }
+
+                nuevas = []
+                for item in items:
+                    slot = (item['medico_id'], item['fecha_hora'])
+                    if slot in ocupados:
+                        results[item['id']] = {
+                            'estado': 'conflicto',
+                            'mensaje': f'El horario {item["fecha_hora"].strftime("%H:%M")} del '
+                                       f'{item["fecha_hora"].strftime("%Y-%m-%d")} ya está ocupado para el '
+                                       f'Dr./Dra. {item["medico_nombre"]}.',
+                        }
+                        continue
+                    ocupados.add(slot)
+                    cita = Cita(
+                        paciente_id=item['paciente_id'],
+                        medico_id=item['medico_id'],
+                        fecha_hora=item['fecha_hora'],
+                        motivo=item['motivo']
+                    )
+                    db.session.add(cita)
+                    nuevas.append((item, cita))
+
+                if nuevas:
+                    db.session.flush()
+                    registrar_cambios([cita for _, cita in nuevas], 'creada')
+                    get_slot_holds().release_slots((item['medico_id'], item['fecha_hora']) for item, _ in nuevas)
+                for item, cita in nuevas:
+                    results[item['id']] = {
+                        'estado': 'confirmada',
+                        'cita_id': cita.id,
+                        'mensaje': f'Cita agendada exitosamente con el Dr./Dra. {item["medico_nombre"]} el '
+                                   f'{item["fecha_hora"].strftime("%Y-%m-%d")} a las '
+                                   f'{item["fecha_hora"].strftime("%H:%M")}.',
+                    }
+                self._guardar_resultados(results)
+                db.session.commit()
+            except Exception:
+                db.session.rollback()
+                raise
+
+    def _guardar_resultados(self, results: Dict[int, Dict]) -> None:
+        """Anotar el resultado de cada solicitud en la transacción actual"""
+        now = time.time()
+        db.session.execute(update(SolicitudCita), [
+            {'id': solicitud_id, 'cita_id': None, **result, 'procesada': now}
+            for solicitud_id, result in results.items()
+        ])
+
+    def _purgar(self) -> None:
+        # Descartar de vez en cuando los resultados que ya nadie va a consultar
+        now = time.time()
+        if now < self._proxima_purga:
+            return
+        self._proxima_purga = now + self.PURGA_CADA
+        db.session.execute(delete(SolicitudCita).where(SolicitudCita.procesada < now - self.result_ttl))
+        db.session.commit()
+
+def get_booking_queue() -> BookingQueue:
+    """Cola de reservas de la aplicación actual; el hilo escritor arranca en el primer uso"""
+    booking_queue = current_app.extensions.get('booking_queue')
+    if booking_queue is None:
+        with appointment_lock:
+            booking_queue = current_app.extensions.get('booking_queue')
+            if booking_queue is None:
+                booking_queue = BookingQueue(
+                    current_app._get_current_object(),
+                    batch_size=current_app.config['BOOKING_QUEUE_BATCH_SIZE'],
+                )
+                booking_queue.start()
+                current_app.extensions['booking_queue'] = booking_queue
+    return booking_queue
@@ -0,0 +1,257 @@
+import csv
+import json
+import logging
+from datetime import datetime
+from itertools import islice
+from typing import Dict, IO, Iterable, Iterator, List, Optional, Tuple
+from sqlalchemy import insert, select, union_all
+from sqlalchemy.exc import IntegrityError
+from extensions import db, employees_service, appointment_lock
+from models import User, Cita, CitaArchivada
+from change_feed import registrar_cambios
+
+ESTADOS_VALIDOS = {'programada', 'completada', 'cancelada'}
+CONTADORES = {'conflicto': 'conflictos', 'duplicada': 'duplicadas', 'error': 'errores'}
+
+def clave_cita(valores: Dict) -> Tuple:
+    """Identidad de una cita importada: paciente, médico, hora y si está cancelada.
+
+    Una cita completada es la misma que estuvo programada, y una cancelada
+    puede convivir con otra vigente en el mismo horario.
+    """
+    return (valores['paciente_id'], valores['medico_id'], valores['fecha_hora'],
+            valores['estado'] == 'cancelada')
+
+def leer_filas(stream: IO[str], formato: str) -> Iterator[Dict]:
+    """Leer filas de un archivo CSV (con cabecera) o NDJSON (un objeto JSON por línea)"""
+    if formato == 'csv':
+        yield from csv.DictReader(stream)
+    elif formato == 'ndjson':
+        for linea in stream:
+            linea = linea.strip()
+            if not linea:
+                continue
+            try:
+                fila = json.loads(linea)
+            except ValueError as e:
+                # Una línea corrupta se informa como error de esa fila
+                fila = {'_error': f'JSON inválido: {e}'}
+            yield fila if isinstance(fila, dict) else {'_error': 'Se esperaba un objeto JSON'}
+    else:
+        raise ValueError(f'Formato no soportado: {formato}')
+
+def detectar_formato(nombre: Optional[str], content_type: Optional[str] = None) -> str:
+    nombre = (nombre or '').lower()
+    content_type = (content_type or '').lower()
+    if nombre.endswith(('.ndjson', '.jsonl')) or 'ndjson' in content_type or 'jsonl' in content_type:
+        return 'ndjson'
+    return 'csv'
+
+def _parse_fecha_hora(fila: Dict) -> datetime:
+    if fila.get('fecha_hora'):
+        fecha_hora = datetime.fromisoformat(str(fila['fecha_hora']))
+        if fecha_hora.tzinfo is not None:
+            # '2027-01-06T10:00:00Z' o con desfase: las citas se guardan en hora local sin zona
+            fecha_hora = fecha_hora.astimezone().replace(tzinfo=None)
+        return fecha_hora
+    return datetime.strptime(f"{fila.get('fecha')} {fila.get('hora')}", '%Y-%m-%d %H:%M')
+
+class ImportadorCitas:
+    """Importación masiva de citas por bloques.
+
+    El directorio de médicos se carga una sola vez; en cada bloque los
+    pacientes, los duplicados y los conflictos se resuelven con una consulta
+    por conjunto y las citas válidas se insertan con un único executemany por
+    transacción, junto con su registro de cambios.
+
+    Una fila igual a una cita que ya existe (vigente o archivada, ver
+    clave_cita) se informa como 'duplicada' y no se inserta, así que volver
+    a importar un archivo tras un fallo a mitad no repite las filas de los
+    bloques que ya se confirmaron.
+    """
+
+    def __init__(self, chunk_size: int = 5000, max_detalle: int = 10000, max_intentos: int = 3):
+        self.chunk_size = chunk_size
+        self.max_intentos = max_intentos
+        self.max_detalle = max_detalle
+        self.medicos = {doc['id']: doc for doc in employees_service.get_all_doctors()}
+        self.vistos = set()  # horarios programados ya importados en esta ejecución
+        self.importadas = set()  # clave_cita de las filas ya importadas en esta ejecución
+        self.reporte = {'total': 0, 'insertadas': 0, 'conflictos': 0, 'duplicadas': 0, 'errores': 0,
+                        'ultima_fila_confirmada': 0, 'filas': []}
+
+    def _anotar(self, numero: int, estado: str, motivo: str) -> None:
+        self.reporte[CONTADORES[estado]] += 1
+        if len(self.reporte['filas']) < self.max_detalle:
+            self.reporte['filas'].append({'fila': numero, 'estado': estado, 'motivo': motivo})
+
+    def _validar(self, bloque: List[Tuple[int, Dict]]) -> List[Tuple[int, Dict]]:
+        """Convertir las filas en valores de Cita; las inválidas van al reporte"""
+        emails = {f['paciente_email'].strip().lower() for _, f in bloque
+                  if f.get('paciente_email') and not f.get('paciente_id')}
+        ids = set()
+        for _, f in bloque:
+            try:
+                ids.add(int(f['paciente_id']))
+            except (KeyError, TypeError, ValueError):
+                pass
+        pacientes_por_email = dict(db.session.query(db.func.lower(User.email), User.id)
+                                   .filter(db.func.lower(User.email).in_(emails))) if emails else {}
+        pacientes = {uid for (uid,) in db.session.query(User.id).filter(User.id.in_(ids))} if ids else set()
+
+        validas = []
+        for numero, fila in bloque:
+            if '_error' in fila:
+                self._anotar(numero, 'error', fila['_error'])
+                continue
+            medico_id = str(fila.get('medico_id') or '').strip()
+            if medico_id not in self.medicos:
+                self._anotar(numero, 'error', f'El médico con ID {medico_id or "(vacío)"} no existe')
+                continue
+            try:
+                fecha_hora = _parse_fecha_hora(fila)
+            except (TypeError, ValueError):
+                self._anotar(numero, 'error', 'El formato de fecha u hora es inválido')
+                continue
+            if fila.get('paciente_id'):
+                try:
+                    paciente_id = int(fila['paciente_id'])
+                except (TypeError, ValueError):
+                    paciente_id = None
+                if paciente_id not in pacientes:
+                    paciente_id = None
+            else:
+                paciente_id = pacientes_por_email.get((fila.get('paciente_email') or '').strip().lower())
+            if paciente_id is None:
+                self._anotar(numero, 'error', 'Paciente no encontrado')
+                continue
+            estado = (fila.get('estado') or 'programada').strip().lower()
+            if estado not in ESTADOS_VALIDOS:
+                self._anotar(numero, 'error', f'Estado inválido: {estado}')
+                continue
+            if estado == 'programada' and fecha_hora >= datetime.now() \
+                    and not self.medicos[medico_id].get('activo', False):
+                self._anotar(numero, 'error', f'El médico {medico_id} no está activo')
+                continue
+            validas.append((numero, {
+                'paciente_id': paciente_id,
+                'medico_id': medico_id,
+                'fecha_hora': fecha_hora,
+                'motivo': fila.get('motivo') or '',
+                'estado': estado,
+                'notas': fila.get('notas') or None,
+                'fecha_creacion': datetime.utcnow(),
+            }))
+        return validas
+
+    def _importar_bloque(self, bloque: List[Tuple[int, Dict]]) -> None:
+        validas = self._validar(bloque)
+        for intento in range(self.max_intentos):
+            try:
+                duplicadas, conflictos, filas = self._insertar(validas)
+                break
+            except IntegrityError:
+                # Otro proceso ocupó alguno de estos horarios entre la consulta y el
+                # commit; al repetir, la consulta del bloque ya lo ve como conflicto
+                if intento == self.max_intentos - 1:
+                    raise
+
+        for numero, valores in duplicadas:
+            self._anotar(numero, 'duplicada',
+                         f'La cita del {valores["fecha_hora"].strftime("%Y-%m-%d %H:%M")} '
+                         f'con el médico {valores["medico_id"]} ya existe')
+        for numero, valores in conflictos:
+            self._anotar(numero, 'conflicto',
+                         f'El horario {valores["fecha_hora"].strftime("%Y-%m-%d %H:%M")} '
+                         f'ya está ocupado para el médico {valores["medico_id"]}')
+        self.vistos.update((v['medico_id'], v['fecha_hora']) for v in filas if v['estado'] == 'programada')
+        self.importadas.update(clave_cita(v) for v in filas)
+        self.reporte['insertadas'] += len(filas)
+        self.reporte['ultima_fila_confirmada'] = bloque[-1][0]
+
+    def _existentes(self, validas: List[Tuple[int, Dict]]) -> set:
+        """clave_cita de las citas vigentes o archivadas que coinciden con el bloque (una consulta)"""
+        if not validas:
+            return set()
+        fechas = [v['fecha_hora'] for _, v in validas]
+        consulta = union_all(*[
+            select(modelo.paciente_id, modelo.medico_id, modelo.fecha_hora, modelo.estado).where(
+                modelo.paciente_id.in_({v['paciente_id'] for _, v in validas}),
+                modelo.medico_id.in_({v['medico_id'] for _, v in validas}),
+                modelo.fecha_hora.between(min(fechas), max(fechas))
+            ) for modelo in (Cita, CitaArchivada)
+        ])
+        return {clave_cita(fila) for fila in db.session.execute(consulta).mappings()}
+
+    def _insertar(self, validas: List[Tuple[int, Dict]]) -> Tuple[List, List, List[Dict]]:
+        """Insertar en una transacción las filas nuevas y sin conflicto.
+
+        Devuelve (duplicadas, conflictos, insertadas).
+        """
+        programadas = [v for _, v in validas if v['estado'] == 'programada']
+        with appointment_lock:
+            existentes = self._existentes(validas)
+            ocupados = set()
+            if programadas:
+                # Una sola consulta por conjunto para todo el bloque
+                ocupados = set(db.session.query(Cita.medico_id, Cita.fecha_hora).filter(
+                    Cita.estado == 'programada',
+                    Cita.medico_id.in_({v['medico_id'] for v in programadas}),
+                    Cita.fecha_hora.between(min(v['fecha_hora'] for v in programadas),
+                                            max(v['fecha_hora'] for v in programadas))
+                ))
+
+            duplicadas, conflictos, filas = [], [], []
+            for numero, valores in validas:
+                clave = clave_cita(valores)
+                if clave in existentes or clave in self.importadas:
+                    duplicadas.append((numero, valores))
+                    continue
+                existentes.add(clave)
+                if valores['estado'] == 'programada':
+                    slot = (valores['medico_id'], valores['fecha_hora'])
+                    if slot in ocupados or slot in self.vistos:
+                        conflictos.append((numero, valores))
+                        continue
+                    ocupados.add(slot)
+                filas.append(valores)
+
+            if filas:
+                try:
+                    ids = db.session.execute(
+                        insert(Cita).returning(Cita.id, sort_by_parameter_order=True), filas
+                    ).scalars().all()
+                    registrar_cambios([dict(valores, id=cita_id) for valores, cita_id in zip(filas, ids)],
+                                      'creada')
+                    db.session.commit()
+                except Exception:
+                    db.session.rollback()
+                    raise
+        return duplicadas, conflictos, filas
+
+    def importar(self, filas: Iterable[Dict]) -> Dict:
+        """Importar todas las filas y devolver el reporte.
+
+        Si un bloque falla, los anteriores ya están confirmados: la importación
+        se detiene y el reporte parcial lleva 'interrumpida' con la causa y
+        'ultima_fila_confirmada'.
+        """
+        numeradas = enumerate(filas, start=1)
+        while True:
+            try:
+                bloque = list(islice(numeradas, self.chunk_size))
+                if not bloque:
+                    break
+                self.reporte['total'] += len(bloque)
+                self._importar_bloque(bloque)
+            except Exception as e:
+                logging.error(f"Importación interrumpida tras la fila "
+                              f"{self.reporte['ultima_fila_confirmada']}: {e}")
+                self.reporte['interrumpida'] = str(e)
+                break
+        self.reporte['filas'].sort(key=lambda f: f['fila'])
+        return self.reporte
+
+def importar_citas(stream: IO[str], formato: str, chunk_size: int = 5000) -> Dict:
+    """Importar citas desde un flujo de texto CSV/NDJSON y devolver el reporte por fila"""
+    return ImportadorCitas(chunk_size).importar(leer_filas(stream, formato))
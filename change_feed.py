@@ -0,0 +1,91 @@
+from datetime import datetime, timedelta
+from typing import Dict, Iterable, Optional
+from sqlalchemy import delete, insert, select
+from extensions import db
+from models import Cita, CambioCita
+
+def _fila_cambio(cita, tipo: str, ahora: datetime) -> Dict:
+    # Acepta tanto objetos Cita como filas/dicts con las mismas columnas
+    get = cita.get if isinstance(cita, dict) else lambda campo: getattr(cita, campo)
+    return {
+        'cita_id': get('id'),
+        'tipo': tipo,
+        'paciente_id': get('paciente_id'),
+        'medico_id': get('medico_id'),
+        'fecha_hora': get('fecha_hora'),
+        'estado': get('estado'),
+        'fecha_cambio': ahora,
+    }
+
+def registrar_cambio(cita: Cita, tipo: str) -> None:
+    """Anotar un cambio en la sesión actual; se confirma en el mismo commit que la cita"""
+    if cita.id is None:
+        db.session.flush()
+    db.session.add(CambioCita(**_fila_cambio(cita, tipo, datetime.utcnow())))
+
+def registrar_cambios(citas: Iterable, tipo: str) -> None:
+    """Anotar cambios de muchas citas con un único executemany en la transacción actual"""
+    ahora = datetime.utcnow()
+    filas = [_fila_cambio(cita, tipo, ahora) for cita in citas]
+    if filas:
+        db.session.execute(insert(CambioCita), filas)
+
+# En PostgreSQL el seq se asigna antes del commit, así que una transacción
+# lenta puede hacer visible un seq menor después de otro mayor. Un hueco en la
+# secuencia se espera este tiempo antes de darlo por definitivo (transacción
+# revertida o cambio purgado). En SQLite los escritores van en serie y solo la
+# purga deja huecos, que ya son antiguos.
+ESPERA_HUECOS = timedelta(seconds=10)
+
+def cambios_desde(cursor: int = 0, limite: int = 100, medico_id: Optional[str] = None,
+                  ahora: Optional[datetime] = None) -> Dict:
+    """Cambios con secuencia mayor que cursor, en orden; devuelve el nuevo cursor.
+
+    El cursor no avanza más allá de un hueco reciente en la secuencia, por si
+    el cambio que falta aún no se ha confirmado. El filtro por médico se
+    aplica después, para que los huecos se vean en la secuencia completa.
+    """
+    filas = db.session.execute(
+        select(CambioCita).where(CambioCita.seq > cursor).order_by(CambioCita.seq).limit(limite + 1)
+    ).scalars().all()
+    hay_mas = len(filas) > limite
+    filas = filas[:limite]
+    ahora = ahora or datetime.utcnow()
+    esperado = cursor + 1
+    for i, fila in enumerate(filas):
+        if fila.seq != esperado and ahora - fila.fecha_cambio < ESPERA_HUECOS:
+            filas, hay_mas = filas[:i], False
+            break
+        esperado = fila.seq + 1
+    cambios = [c for c in filas if not medico_id or c.medico_id == medico_id]
+    return {
+        'cambios': [{
+            'seq': c.seq,
+            'cita_id': c.cita_id,
+            'tipo': c.tipo,
+            'paciente_id': c.paciente_id,
+            'medico_id': c.medico_id,
+            'fecha_hora': c.fecha_hora.isoformat() if c.fecha_hora else None,
+            'estado': c.estado,
+            'fecha_cambio': c.fecha_cambio.isoformat(),
+        } for c in cambios],
+        'cursor': filas[-1].seq if filas else cursor,
+        'hay_mas': hay_mas,
+    }
+
+def purgar_cambios(dias: int, lote: int = 1000) -> int:
+    """Borrar por lotes los cambios más antiguos que 'dias' días"""
+    limite = datetime.utcnow() - timedelta(days=dias)
+    total = 0
+    while True:
+        seqs = db.session.execute(
+            select(CambioCita.seq).where(CambioCita.fecha_cambio < limite).order_by(CambioCita.seq).limit(lote)
+        ).scalars().all()
+        if not seqs:
+            break
+        db.session.execute(delete(CambioCita).where(CambioCita.seq.in_(seqs)))
+        db.session.commit()
+        total += len(seqs)
+        if len(seqs) < lote:
+            break
+    return total
@@ -0,0 +1,98 @@
+import os
+
+
+class Config:
+    """Configuración base compartida por todos los perfiles"""
+    SECRET_KEY = os.getenv('SECRET_KEY', 'tu_clave_secreta_muy_segura_aqui')
+    SQLALCHEMY_DATABASE_URI = os.getenv('DATABASE_URL', 'sqlite:///medical_system.db')
+    SQLALCHEMY_TRACK_MODIFICATIONS = False
+    NEST_API_URL = os.getenv('NEST_API_URL', 'http://localhost:3000')
+    # Ruta del snapshot del directorio de médicos; None = <instance>/doctors_snapshot.json
+    DOCTORS_SNAPSHOT_PATH = os.getenv('DOCTORS_SNAPSHOT_PATH')
+    DOCTORS_CACHE_TTL = int(os.getenv('DOCTORS_CACHE_TTL', '60'))
+    # Reservas en cola con un único escritor por lotes (campañas con mucha demanda).
+    # La cola se guarda en la base de datos: cualquier worker encola y responde el
+    # estado, y uno solo (elegido con cerrojo_escritor) confirma las citas
+    BOOKING_QUEUE_ENABLED = os.getenv('BOOKING_QUEUE_ENABLED', '0') == '1'
+    BOOKING_QUEUE_BATCH_SIZE = int(os.getenv('BOOKING_QUEUE_BATCH_SIZE', '100'))
+    # Segundos máximos que un cliente puede esperar la confirmación en la misma petición
+    BOOKING_QUEUE_MAX_WAIT = float(os.getenv('BOOKING_QUEUE_MAX_WAIT', '10'))
+    # Segundos que un paciente puede retener un horario mientras completa la reserva
+    SLOT_HOLD_TTL = int(os.getenv('SLOT_HOLD_TTL', '300'))
+    # Filas por transacción en la importación masiva de citas
+    IMPORT_CHUNK_SIZE = int(os.getenv('IMPORT_CHUNK_SIZE', '5000'))
+    # Rango máximo (en días) de las consultas de analítica de ocupación
+    ANALYTICS_MAX_DAYS = int(os.getenv('ANALYTICS_MAX_DAYS', '731'))
+    # Flujos SSE de disponibilidad: cada cliente mantiene una conexión abierta, así
+    # que solo se activan con workers asíncronos (gevent) o el servidor de desarrollo
+    SSE_ENABLED = os.getenv('SSE_ENABLED', '0') == '1'
+    # Segundos entre mensajes keep-alive en los flujos SSE de disponibilidad
+    SSE_HEARTBEAT = float(os.getenv('SSE_HEARTBEAT', '15'))
+    # Cada cuántos segundos se lee el registro de cambios para difundirlo por SSE
+    SSE_POLL_INTERVAL = float(os.getenv('SSE_POLL_INTERVAL', '1'))
+    # Las citas completadas o canceladas se archivan pasados estos días
+    MAINTENANCE_ARCHIVE_DAYS = int(os.getenv('MAINTENANCE_ARCHIVE_DAYS', '90'))
+    MAINTENANCE_BATCH_SIZE = int(os.getenv('MAINTENANCE_BATCH_SIZE', '1000'))
+    # Días que se conservan las entradas del registro de cambios de citas
+    CHANGE_FEED_RETENTION_DAYS = int(os.getenv('CHANGE_FEED_RETENTION_DAYS', '30'))
+    # Máximo de citas en una serie recurrente (semanal o quincenal)
+    SERIES_MAX_OCCURRENCES = int(os.getenv('SERIES_MAX_OCCURRENCES', '52'))
+    # Control de admisión: 'memory' (por worker), 'sqlite' (compartido entre
+    # workers de la misma máquina) o 'modulo:Clase' con un backend propio
+    RATE_LIMIT_BACKEND = os.getenv('RATE_LIMIT_BACKEND', 'memory')
+    RATE_LIMIT_SQLITE_PATH = os.getenv('RATE_LIMIT_SQLITE_PATH')
+    # Límites por endpoint para cada usuario autenticado y cada IP
+    RATE_LIMITS = {
+        'main.buscar_horarios': {'usuario': '60/minute', 'ip': '120/minute'},
+        'main.agendar_cita': {'usuario': '10/minute', 'ip': '30/minute'},
+        'main.agendar_serie': {'usuario': '5/minute', 'ip': '15/minute'},
+        'main.retener_horario': {'usuario': '30/minute', 'ip': '60/minute'},
+        'main.buscar_medicos_typeahead': {'ip': '300/minute'},
+        'main.login': {'ip': '20/minute'},
+    }
+    # Número de proxies de confianza delante de la aplicación; con 0 se usa la
+    # IP de la conexión y X-Forwarded-For se ignora (los límites por IP la usan)
+    PROXY_FIX_X_FOR = int(os.getenv('PROXY_FIX_X_FOR', '0'))
+    # Peticiones simultáneas por worker antes de responder 503 (0 = sin límite)
+    MAX_IN_FLIGHT = int(os.getenv('MAX_IN_FLIGHT', '64'))
+    # Si NestJS tarda más que esto (segundos) y no hay copia del directorio,
+    # estas rutas responden 503 en lugar de esperar
+    UPSTREAM_LATENCY_LIMIT = float(os.getenv('UPSTREAM_LATENCY_LIMIT', '2'))
+    UPSTREAM_ENDPOINTS = {
+        'main.buscar_medicos', 'main.buscar_horarios', 'main.agendar_cita', 'main.agendar_serie',
+        'main.retener_horario', 'main.get_especialidades', 'main.get_medicos_por_especialidad',
+        'main.buscar_medicos_typeahead',
+    }
+    # Réplica de solo lectura (PostgreSQL); con SQLite se abre el mismo archivo en modo ro
+    SQLALCHEMY_READ_DATABASE_URI = os.getenv('READ_DATABASE_URL')
+    # Segundos tras una escritura en que ese usuario sigue leyendo del primario
+    READ_YOUR_WRITES_WINDOW = float(os.getenv('READ_YOUR_WRITES_WINDOW', '5'))
+    DEBUG = False
+    TESTING = False
+
+
+class DevelopmentConfig(Config):
+    DEBUG = True
+    # El servidor de desarrollo crea un hilo por conexión
+    SSE_ENABLED = os.getenv('SSE_ENABLED', '1') == '1'
+
+
+class ProductionConfig(Config):
+    # Reciclar conexiones que lleven abiertas mucho tiempo en cada worker
+    SQLALCHEMY_ENGINE_OPTIONS = {'pool_pre_ping': True, 'pool_recycle': 1800}
+    DOCTORS_CACHE_TTL = int(os.getenv('DOCTORS_CACHE_TTL', '300'))
+    # En producción gunicorn va detrás de un proxy inverso
+    PROXY_FIX_X_FOR = int(os.getenv('PROXY_FIX_X_FOR', '1'))
+
+
+class TestingConfig(Config):
+    TESTING = True
+    SQLALCHEMY_DATABASE_URI = os.getenv('TEST_DATABASE_URL', 'sqlite:///:memory:')
+
+
+config = {
+    'development': DevelopmentConfig,
+    'production': ProductionConfig,
+    'testing': TestingConfig,
+    'default': DevelopmentConfig,
+}
@@ -0,0 +1,26 @@
+import pytest
+from app import create_app, init_db
+from extensions import db
+
+@pytest.fixture
+def app():
+    """Aplicación de pruebas con una base de datos SQLite en memoria"""
+    app = create_app('testing')
+    with app.app_context():
+        init_db()
+        yield app
+        db.session.remove()
+        db.drop_all()
+
+@pytest.fixture
+def cliente(app):
+    """Cliente de pruebas con la sesión iniciada de un paciente (id 1)"""
+    from werkzeug.security import generate_password_hash
+    from models import User
+    db.session.add(User(id=1, email='paciente@example.com', nombre='Paciente',
+                        password_hash=generate_password_hash('secreta')))
+    db.session.commit()
+    cliente = app.test_client()
+    respuesta = cliente.post('/login', json={'email': 'paciente@example.com', 'password': 'secreta'})
+    assert respuesta.status_code == 200
+    return cliente
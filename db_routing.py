@@ -0,0 +1,96 @@
+import threading
+import time
+from functools import wraps
+from typing import Optional
+from flask import Flask, current_app, g, has_app_context, session
+from sqlalchemy import create_engine, event
+from sqlalchemy.engine import Engine
+from sqlalchemy.orm import Session, sessionmaker
+from extensions import db
+
+_preparar_lock = threading.Lock()
+
+def _es_archivo_sqlite(url) -> bool:
+    return url.get_backend_name() == 'sqlite' and url.database not in (None, '', ':memory:')
+
+def _crear_engine_lectura(app: Flask) -> Optional[Engine]:
+    """Réplica configurada, conexión SQLite de solo lectura o None (usar el primario)"""
+    opciones = app.config.get('SQLALCHEMY_ENGINE_OPTIONS', {})
+    if app.config.get('SQLALCHEMY_READ_DATABASE_URI'):
+        return create_engine(app.config['SQLALCHEMY_READ_DATABASE_URI'], **opciones)
+
+    url = db.engine.url
+    if not _es_archivo_sqlite(url):
+        return None
+    return create_engine(f'sqlite:///file:{url.database}?mode=ro&uri=true', **opciones)
+
+def _sessionmaker_lectura(app: Flask) -> Optional[sessionmaker]:
+    """Preparar en el primer uso el engine de lectura y activar WAL en el primario"""
+    if 'read_sessionmaker' not in app.extensions:
+        with _preparar_lock:
+            if 'read_sessionmaker' not in app.extensions:
+                if _es_archivo_sqlite(db.engine.url):
+                    # WAL permite que las lecturas no bloqueen a la escritura de citas (y
+                    # viceversa); queda guardado en el archivo, basta con activarlo una vez
+                    with db.engine.connect() as conn:
+                        conn.exec_driver_sql('PRAGMA journal_mode=WAL')
+                engine = _crear_engine_lectura(app)
+                app.extensions['read_engine'] = engine
+                app.extensions['read_sessionmaker'] = sessionmaker(bind=engine) if engine is not None else None
+    return app.extensions['read_sessionmaker']
+
+def init_app(app: Flask) -> None:
+    """Registrar el enrutado de lectura; el engine de lectura se crea en la primera consulta"""
+    # Tras cada commit del primario se recuerda la escritura para leer lo propio
+    @event.listens_for(db.session, 'after_commit')
+    def _marcar_escritura(db_session):
+        if has_app_context():
+            g._hubo_escritura = True
+
+    @app.after_request
+    def _recordar_escritura(response):
+        if g.pop('_hubo_escritura', False):
+            marcar_escritura()
+        return response
+
+    @app.teardown_appcontext
+    def _cerrar_sesion_lectura(exc=None):
+        sesion = g.pop('_sesion_lectura', None)
+        if sesion is not None:
+            sesion.close()
+
+def marcar_escritura(momento: Optional[float] = None) -> None:
+    """Registrar en la sesión del usuario que acaba de escribir (para read-your-writes)"""
+    session['ultima_escritura'] = momento or time.time()
+
+def dispose(app: Flask) -> None:
+    engine = app.extensions.get('read_engine')
+    if engine is not None:
+        engine.dispose(close=False)
+
+def read_only(func):
+    """Marcar una ruta como de solo lectura: sus consultas van al engine de lectura"""
+    @wraps(func)
+    def wrapper(*args, **kwargs):
+        g.solo_lectura = True
+        return func(*args, **kwargs)
+    return wrapper
+
+def _usar_lectura() -> bool:
+    if not g.get('solo_lectura') or _sessionmaker_lectura(current_app._get_current_object()) is None:
+        return False
+    # Read-your-writes: justo después de escribir se lee del primario
+    ultima = session.get('ultima_escritura')
+    return ultima is None or time.time() - ultima > current_app.config['READ_YOUR_WRITES_WINDOW']
+
+def read_session() -> Session:
+    """Sesión para las consultas de la petición actual (de lectura o db.session)"""
+    if not _usar_lectura():
+        return db.session
+    if '_sesion_lectura' not in g:
+        g._sesion_lectura = current_app.extensions['read_sessionmaker']()
+    return g._sesion_lectura
+
+def consulta(*entidades):
+    """Equivalente a Modelo.query que respeta el enrutado de lectura/escritura"""
+    return read_session().query(*entidades)
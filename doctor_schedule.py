@@ -0,0 +1,17 @@
+from datetime import datetime, time, timedelta
+from typing import Dict, List
+
+def horarios_del_medico(medico: Dict) -> List[time]:
+    """Rejilla de horarios de un día según horario_inicio, horario_fin y duracion_cita"""
+    inicio = datetime.strptime(medico.get('horario_inicio', '08:00'), '%H:%M')
+    fin = datetime.strptime(medico.get('horario_fin', '17:00'), '%H:%M')
+    duracion = int(medico.get('duracion_cita') or 30)
+    if duracion < 0:
+        raise ValueError(f'duracion_cita inválida: {duracion}')
+    paso = timedelta(minutes=duracion)
+    horarios = []
+    actual = inicio
+    while actual < fin:
+        horarios.append(actual.time())
+        actual += paso
+    return horarios
@@ -0,0 +1,117 @@
+import re
+import threading
+import unicodedata
+from bisect import bisect_left
+from typing import Dict, List, Optional, Set
+
+_PALABRA = re.compile(r'\w+')
+
+def normalizar(texto: str) -> str:
+    """Minúsculas y sin tildes: 'Cardiología' -> 'cardiologia'"""
+    descompuesto = unicodedata.normalize('NFKD', texto or '')
+    return ''.join(c for c in descompuesto if not unicodedata.combining(c)).casefold()
+
+def tokenizar(texto: str) -> List[str]:
+    return _PALABRA.findall(normalizar(texto))
+
+class DoctorSearchIndex:
+    """Índice en memoria del directorio de médicos para búsquedas por prefijo.
+
+    Los nombres y especialidades se guardan como tokens normalizados en una
+    lista ordenada; un prefijo se resuelve con búsqueda binaria sobre ella y
+    la unión de las listas invertidas de los tokens que lo comparten.
+    """
+
+    def __init__(self):
+        self._doctores: Dict[str, Dict] = {}
+        self._orden: Dict[str, int] = {}             # posición en el directorio
+        self._tokens_doctor: Dict[str, Set[str]] = {}
+        self._invertido: Dict[str, Set[str]] = {}    # token -> ids
+        self._por_especialidad: Dict[str, Set[str]] = {}
+        self._tokens_ordenados: List[str] = []
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self._doctores)
+
+    def _quitar(self, doctor_id: str) -> None:
+        doctor = self._doctores.pop(doctor_id)
+        for token in self._tokens_doctor.pop(doctor_id):
+            ids = self._invertido[token]
+            ids.discard(doctor_id)
+            if not ids:
+                del self._invertido[token]
+        especialidad = normalizar(doctor.get('especialidad', ''))
+        ids = self._por_especialidad.get(especialidad)
+        if ids is not None:
+            ids.discard(doctor_id)
+            if not ids:
+                del self._por_especialidad[especialidad]
+
+    def _agregar(self, doctor: Dict) -> None:
+        doctor_id = doctor['id']
+        tokens = set(tokenizar(doctor.get('name', ''))) | set(tokenizar(doctor.get('especialidad', '')))
+        self._doctores[doctor_id] = doctor
+        self._tokens_doctor[doctor_id] = tokens
+        for token in tokens:
+            self._invertido.setdefault(token, set()).add(doctor_id)
+        self._por_especialidad.setdefault(normalizar(doctor.get('especialidad', '')), set()).add(doctor_id)
+
+    def update(self, doctores: List[Dict]) -> int:
+        """Sincronizar el índice con el directorio; solo reindexa los médicos que cambiaron"""
+        nuevos = {d['id']: d for d in doctores if d.get('id') is not None}
+        with self._lock:
+            cambios = 0
+            for doctor_id in [i for i in self._doctores if i not in nuevos]:
+                self._quitar(doctor_id)
+                cambios += 1
+            for doctor_id, doctor in nuevos.items():
+                anterior = self._doctores.get(doctor_id)
+                if anterior == doctor:
+                    continue
+                if anterior is not None:
+                    self._quitar(doctor_id)
+                self._agregar(doctor)
+                cambios += 1
+            self._orden = {doctor_id: i for i, doctor_id in enumerate(nuevos)}
+            if cambios:
+                self._tokens_ordenados = sorted(self._invertido)
+            return cambios
+
+    def _ids_con_prefijo(self, prefijo: str) -> Set[str]:
+        tokens = self._tokens_ordenados
+        ids: Set[str] = set()
+        i = bisect_left(tokens, prefijo)
+        while i < len(tokens) and tokens[i].startswith(prefijo):
+            ids |= self._invertido[tokens[i]]
+            i += 1
+        return ids
+
+    def search(self, consulta: str, activo: Optional[bool] = None,
+               especialidad: Optional[str] = None, limite: int = 10) -> List[Dict]:
+        """Médicos cuyo nombre o especialidad contiene palabras que empiezan por cada término"""
+        terminos = tokenizar(consulta)
+        if not terminos:
+            return []
+        with self._lock:
+            ids = None
+            for termino in terminos:
+                coincidencias = self._ids_con_prefijo(termino)
+                ids = coincidencias if ids is None else ids & coincidencias
+                if not ids:
+                    return []
+            if especialidad:
+                ids &= self._por_especialidad.get(normalizar(especialidad), set())
+            doctores = [self._doctores[i] for i in ids]
+            if activo is not None:
+                doctores = [d for d in doctores if bool(d.get('activo', False)) == activo]
+            # Primero los que tienen palabras completas iguales a los términos
+            doctores.sort(key=lambda d: (-len(self._tokens_doctor[d['id']] & set(terminos)),
+                                         normalizar(d.get('name', ''))))
+            return doctores[:limite]
+
+    def by_specialty(self, especialidad: str) -> List[Dict]:
+        """Médicos de una especialidad sin distinguir mayúsculas ni tildes, en orden del directorio"""
+        with self._lock:
+            ids = self._por_especialidad.get(normalizar(especialidad), set())
+            return [self._doctores[i] for i in sorted(ids, key=self._orden.get)]
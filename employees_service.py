@@ -1,28 +1,182 @@
 import requests
 from typing import List, Dict, Optional
 from datetime import datetime, time
+import json
 import logging
+import os
+import tempfile
+import threading
+import time as _time
+from doctor_search import DoctorSearchIndex
 
 class EmployeesService:
-    def __init__(self, nest_api_base_url: str = "http://localhost:3000"):
+    # Segundos de espera tras un fallo de NestJS: 5, 10, 20... hasta 5 minutos
+    BACKOFF_INICIAL = 5.0
+    MAX_BACKOFF = 300.0
+
+    def __init__(self, nest_api_base_url: str = "http://localhost:3000",
+                 snapshot_path: Optional[str] = None, cache_ttl: int = 60):
         self.base_url = nest_api_base_url
         self.employees_endpoint = f"{self.base_url}/employees"
-        
-    def get_all_doctors(self) -> List[Dict]:
-        """Obtener todos los empleados (doctores) del sistema NestJS"""
+        # Copia local del último directorio válido (stale-while-revalidate)
+        self.snapshot_path = snapshot_path
+        self.cache_ttl = cache_ttl
+        self._doctors: Optional[List[Dict]] = None
+        self._fetched_at: Optional[float] = None
+        self._origen = None
+        self._ultimo_error: Optional[str] = None
+        self._lock = threading.Lock()
+        self._refreshing = False
+        # Una sola descarga en el arranque en frío; el resto de peticiones espera su resultado
+        self._cold_start_lock = threading.Lock()
+        # Tras un fallo no se vuelve a consultar NestJS hasta _reintentar_en (backoff exponencial)
+        self._fallos = 0
+        self._reintentar_en = 0.0
+        # Latencia media (EWMA, segundos) de las descargas desde NestJS
+        self.upstream_latency: Optional[float] = None
+        # Índice de búsqueda, actualizado de forma incremental en cada refresco
+        self.search_index = DoctorSearchIndex()
+        if self.snapshot_path:
+            self._load_snapshot()
+
+    def _fetch_doctors(self) -> List[Dict]:
+        """Descargar el directorio de doctores desde NestJS (lanza excepción si falla)"""
+        response = requests.get(self.employees_endpoint, timeout=10)
+        response.raise_for_status()
+
+        employees = response.json()
+        # Filtrar solo los que tienen especialidad (son doctores)
+        return [emp for emp in employees if emp.get('especialidad')]
+
+    def _load_snapshot(self) -> None:
+        """Cargar el último directorio guardado en disco, si existe"""
+        try:
+            with open(self.snapshot_path, 'r', encoding='utf-8') as f:
+                data = json.load(f)
+            self._doctors = data['doctors']
+            self._fetched_at = data['fetched_at']
+            self._origen = 'snapshot'
+            self.search_index.update(self._doctors)
+            logging.info(f"Directorio de doctores cargado desde {self.snapshot_path} "
+                         f"({len(self._doctors)} doctores)")
+        except FileNotFoundError:
+            pass
+        except (OSError, ValueError, KeyError) as e:
+            logging.error(f"Snapshot de doctores inválido en {self.snapshot_path}: {e}")
+
+    def _save_snapshot(self, doctors: List[Dict], fetched_at: float) -> None:
+        """Guardar el directorio en disco reemplazando el archivo de forma atómica"""
+        directory = os.path.dirname(os.path.abspath(self.snapshot_path))
         try:
-            response = requests.get(self.employees_endpoint, timeout=10)
-            response.raise_for_status()
-            
-            employees = response.json()
-            # Filtrar solo los que tienen especialidad (son doctores)
-            doctors = [emp for emp in employees if emp.get('especialidad')]
-            return doctors
-            
-        except requests.exceptions.RequestException as e:
+            os.makedirs(directory, exist_ok=True)
+            fd, tmp_path = tempfile.mkstemp(dir=directory, prefix='.doctors-', suffix='.tmp')
+            try:
+                with os.fdopen(fd, 'w', encoding='utf-8') as f:
+                    json.dump({'fetched_at': fetched_at, 'doctors': doctors}, f,
+                              ensure_ascii=False, separators=(',', ':'))
+                os.replace(tmp_path, self.snapshot_path)
+            except BaseException:
+                os.unlink(tmp_path)
+                raise
+        except OSError as e:
+            logging.error(f"No se pudo guardar el snapshot de doctores: {e}")
+
+    def refresh(self) -> bool:
+        """Actualizar el directorio desde NestJS; conserva la copia anterior si falla"""
+        inicio = _time.monotonic()
+        try:
+            doctors = self._fetch_doctors()
+        except (requests.exceptions.RequestException, ValueError) as e:
             logging.error(f"Error al obtener doctores de NestJS: {e}")
-            return []
-    
+            self._ultimo_error = str(e)
+            self._fallos += 1
+            espera = min(self.MAX_BACKOFF, self.BACKOFF_INICIAL * 2 ** (self._fallos - 1))
+            self._reintentar_en = _time.monotonic() + espera
+            return False
+        finally:
+            self._refreshing = False
+            self._record_latency(_time.monotonic() - inicio)
+
+        fetched_at = _time.time()
+        with self._lock:
+            self._doctors = doctors
+            self._fetched_at = fetched_at
+            self._origen = 'nest'
+            self._ultimo_error = None
+            self._fallos = 0
+            self._reintentar_en = 0.0
+        self.search_index.update(doctors)
+        if self.snapshot_path:
+            self._save_snapshot(doctors, fetched_at)
+        return True
+
+    def _record_latency(self, segundos: float) -> None:
+        if self.upstream_latency is None:
+            self.upstream_latency = segundos
+        else:
+            self.upstream_latency = 0.7 * self.upstream_latency + 0.3 * segundos
+
+    def has_directory(self) -> bool:
+        """Hay una copia del directorio (de NestJS o del snapshot) para responder sin esperar"""
+        return self._doctors is not None
+
+    def refresh_async(self) -> None:
+        """Pedir una actualización en segundo plano sin bloquear al llamador"""
+        self._refresh_in_background()
+
+    def _en_backoff(self) -> bool:
+        """NestJS falló hace poco y todavía no toca volver a intentarlo"""
+        return _time.monotonic() < self._reintentar_en
+
+    def _refresh_in_background(self) -> None:
+        """Lanzar una actualización en segundo plano si no hay otra en curso"""
+        with self._lock:
+            if self._refreshing or self._en_backoff():
+                return
+            self._refreshing = True
+        threading.Thread(target=self.refresh, name='doctors-refresh', daemon=True).start()
+
+    def after_fork(self) -> None:
+        """Reiniciar el estado de sincronización en un proceso hijo tras fork()"""
+        # El hilo de refresco del padre no existe en el hijo y el lock pudo copiarse tomado
+        self._lock = threading.Lock()
+        self._cold_start_lock = threading.Lock()
+        self._refreshing = False
+
+    def directory_age(self) -> Optional[float]:
+        """Segundos transcurridos desde la última descarga válida del directorio"""
+        if self._fetched_at is None:
+            return None
+        return max(0.0, _time.time() - self._fetched_at)
+
+    def directory_status(self) -> Dict:
+        """Estado del directorio en caché para respuestas y métricas"""
+        age = self.directory_age()
+        return {
+            'origen': self._origen,
+            'doctores': len(self._doctors) if self._doctors is not None else 0,
+            'edad_segundos': round(age, 1) if age is not None else None,
+            'actualizado': (datetime.fromtimestamp(self._fetched_at).isoformat()
+                            if self._fetched_at is not None else None),
+            'obsoleto': age is None or age > self.cache_ttl,
+            'ultimo_error': self._ultimo_error,
+            'latencia_nest': round(self.upstream_latency, 3) if self.upstream_latency is not None else None,
+        }
+
+    def get_all_doctors(self) -> List[Dict]:
+        """Obtener todos los empleados (doctores) del sistema NestJS"""
+        if self._doctors is None:
+            # Arranque en frío sin snapshot: no hay nada que servir mientras se descarga
+            with self._cold_start_lock:
+                if self._doctors is None and not self._en_backoff():
+                    self.refresh()
+            if self._doctors is None:
+                return []
+        elif self.directory_age() > self.cache_ttl:
+            # Servir la copia actual y revalidar en segundo plano
+            self._refresh_in_background()
+        return self._doctors
+
     def get_doctor_by_id(self, doctor_id: str) -> Optional[Dict]:
         """Obtener un doctor específico por ID"""
         try:
@@ -31,21 +185,27 @@ class EmployeesService:
         except Exception as e:
             logging.error(f"Error al obtener doctor {doctor_id}: {e}")
             return None
-    
+
     def get_doctors_by_specialty(self, especialidad: str) -> List[Dict]:
         """Obtener doctores por especialidad"""
         try:
-            doctors = self.get_all_doctors()
-            return [doc for doc in doctors if doc.get('especialidad', '').lower() == especialidad.lower()]
+            self.get_all_doctors()
+            return self.search_index.by_specialty(especialidad)
         except Exception as e:
             logging.error(f"Error al obtener doctores por especialidad {especialidad}: {e}")
             return []
-    
+
+    def search_doctors(self, consulta: str, activo: Optional[bool] = None,
+                       especialidad: Optional[str] = None, limite: int = 10) -> List[Dict]:
+        """Búsqueda por prefijo en nombre y especialidad, sin distinguir tildes"""
+        self.get_all_doctors()
+        return self.search_index.search(consulta, activo, especialidad, limite)
+
     def is_doctor_active(self, doctor_id: str) -> bool:
         """Verificar si un doctor está activo"""
         doctor = self.get_doctor_by_id(doctor_id)
         return doctor.get('activo', False) if doctor else False
-    
+
     def sync_doctor_with_local_db(self, db, doctor_data: Dict) -> Optional[object]:
         """Sincronizar datos del doctor con la base de datos local si es necesario"""
         # Esta función puede ser útil si quieres mantener una copia local
@@ -0,0 +1,34 @@
+import os
+import threading
+from flask import current_app
+from flask_sqlalchemy import SQLAlchemy
+from flask_bcrypt import Bcrypt
+from flask_login import LoginManager
+from werkzeug.local import LocalProxy
+from employees_service import EmployeesService
+
+# Extensiones sin aplicación asociada; se enlazan en create_app()
+db = SQLAlchemy()
+bcrypt = Bcrypt()
+login_manager = LoginManager()
+login_manager.login_view = 'main.login'
+
+# Lock para operaciones concurrentes
+appointment_lock = threading.Lock()
+
+
+def get_employees_service() -> EmployeesService:
+    """Crear el servicio de empleados la primera vez que se usa en esta aplicación"""
+    service = current_app.extensions.get('employees_service')
+    if service is None:
+        snapshot_path = current_app.config.get('DOCTORS_SNAPSHOT_PATH') or \
+            os.path.join(current_app.instance_path, 'doctors_snapshot.json')
+        service = EmployeesService(current_app.config['NEST_API_URL'],
+                                   snapshot_path=snapshot_path,
+                                   cache_ttl=current_app.config['DOCTORS_CACHE_TTL'])
+        current_app.extensions['employees_service'] = service
+    return service
+
+
+# Servicio de empleados de la aplicación actual (inicialización perezosa)
+employees_service = LocalProxy(get_employees_service)
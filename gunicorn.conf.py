@@ -0,0 +1,23 @@
+# Configuración de gunicorn para producción: gunicorn wsgi:app
+import multiprocessing
+import os
+
+bind = os.getenv('GUNICORN_BIND', '0.0.0.0:5000')
+workers = int(os.getenv('GUNICORN_WORKERS', multiprocessing.cpu_count() * 2 + 1))
+threads = int(os.getenv('GUNICORN_THREADS', '4'))
+# Con gthread cada cliente SSE (/eventos/horarios) ocuparía un hilo, así que las
+# actualizaciones en vivo solo se activan con GUNICORN_WORKER_CLASS=gevent
+worker_class = os.getenv('GUNICORN_WORKER_CLASS', 'gthread')
+if worker_class in ('gevent', 'eventlet'):
+    os.environ.setdefault('SSE_ENABLED', '1')
+timeout = 30
+
+# Importar la aplicación una sola vez en el maestro para que los workers arranquen rápido
+preload_app = True
+
+
+def post_fork(server, worker):
+    # Cada worker abre sus propias conexiones y reinicia cachés con hilos
+    from wsgi import app
+    from app import init_worker
+    init_worker(app)
@@ -0,0 +1,89 @@
+from datetime import datetime, timedelta
+from typing import Dict, Optional
+from sqlalchemy import delete, insert, select, update
+from extensions import db, appointment_lock
+from models import Cita, CitaArchivada
+from change_feed import registrar_cambios, purgar_cambios
+
+COLUMNAS_CAMBIO = ['id', 'paciente_id', 'medico_id', 'fecha_hora', 'estado']
+COLUMNAS_CITA = ['id', 'paciente_id', 'medico_id', 'fecha_hora', 'motivo', 'estado',
+                 'fecha_creacion', 'notas']
+
+def completar_citas_pasadas(ahora: Optional[datetime] = None, lote: int = 1000) -> int:
+    """Marcar como 'completada' toda cita programada cuya hora ya pasó, por lotes"""
+    ahora = ahora or datetime.now()
+    total = 0
+    while True:
+        with appointment_lock:
+            citas = db.session.execute(
+                select(*[getattr(Cita, c) for c in COLUMNAS_CAMBIO])
+                .where(Cita.estado == 'programada', Cita.fecha_hora < ahora)
+                .order_by(Cita.id)
+                .limit(lote)
+            ).mappings().all()
+            if not citas:
+                break
+            try:
+                db.session.execute(
+                    update(Cita).where(Cita.id.in_([c['id'] for c in citas])).values(estado='completada')
+                )
+                registrar_cambios([dict(c, estado='completada') for c in citas], 'completada')
+                db.session.commit()
+            except Exception:
+                db.session.rollback()
+                raise
+        total += len(citas)
+        if len(citas) < lote:
+            break
+    return total
+
+def archivar_citas(dias: int = 90, lote: int = 1000, ahora: Optional[datetime] = None) -> int:
+    """Mover a cita_archivada las citas completadas o canceladas de hace más de 'dias' días.
+
+    Se procesa por lotes de 'lote' filas, cada uno en su propia transacción,
+    para no bloquear la base de datos durante mucho tiempo.
+    """
+    limite = (ahora or datetime.now()) - timedelta(days=dias)
+    total = 0
+    while True:
+        with appointment_lock:
+            citas = db.session.execute(
+                select(*[getattr(Cita, c) for c in COLUMNAS_CAMBIO])
+                .where(Cita.estado.in_(['completada', 'cancelada']), Cita.fecha_hora < limite)
+                .order_by(Cita.id)
+                .limit(lote)
+            ).mappings().all()
+            if not citas:
+                break
+            ids = [c['id'] for c in citas]
+            try:
+                columnas = [getattr(Cita, c) for c in COLUMNAS_CITA]
+                columnas.append(db.literal(datetime.utcnow(), type_=db.DateTime))
+                db.session.execute(
+                    insert(CitaArchivada).from_select(
+                        COLUMNAS_CITA + ['fecha_archivado'],
+                        select(*columnas).where(Cita.id.in_(ids))
+                    )
+                )
+                db.session.execute(delete(Cita).where(Cita.id.in_(ids)))
+                registrar_cambios(citas, 'archivada')
+                db.session.commit()
+            except Exception:
+                db.session.rollback()
+                raise
+        total += len(ids)
+        if len(ids) < lote:
+            break
+    return total
+
+def ejecutar_mantenimiento(dias: int = 90, lote: int = 1000, dias_cambios: int = 30) -> Dict:
+    """Completar las citas vencidas, archivar las antiguas y purgar el registro de cambios"""
+    completadas = completar_citas_pasadas(lote=lote)
+    archivadas = archivar_citas(dias, lote)
+    cambios_purgados = purgar_cambios(dias_cambios, lote)
+    return {
+        'completadas': completadas,
+        'archivadas': archivadas,
+        'cambios_purgados': cambios_purgados,
+        'timestamp': datetime.now().isoformat()
+    }
@@ -0,0 +1,118 @@
+from datetime import datetime
+from flask_login import UserMixin
+from extensions import db, login_manager, employees_service
+
+# Modelos actualizados
+class User(UserMixin, db.Model):
+    id = db.Column(db.Integer, primary_key=True)
+    email = db.Column(db.String(120), unique=True, nullable=False)
+    password_hash = db.Column(db.String(128), nullable=False)
+    nombre = db.Column(db.String(100), nullable=False)
+    telefono = db.Column(db.String(20))
+    fecha_nacimiento = db.Column(db.Date)
+    fecha_registro = db.Column(db.DateTime, default=datetime.utcnow)
+    is_active = db.Column(db.Boolean, default=True)
+    
+    # Relación con citas
+    citas = db.relationship('Cita', backref='paciente', lazy=True)
+
+class Especialidad(db.Model):
+    id = db.Column(db.Integer, primary_key=True)
+    nombre = db.Column(db.String(100), nullable=False, unique=True)
+    descripcion = db.Column(db.Text)
+
+class Cita(db.Model):
+    # Un horario de un médico solo puede tener una cita programada, aunque
+    # la reserva llegue a la vez a varios workers (índice único parcial).
+    # AUTOINCREMENT: un id archivado en cita_archivada nunca vuelve a usarse
+    __table_args__ = (
+        db.Index('uq_cita_medico_horario_programada', 'medico_id', 'fecha_hora', unique=True,
+                 sqlite_where=db.text("estado = 'programada'"),
+                 postgresql_where=db.text("estado = 'programada'")),
+        {'sqlite_autoincrement': True},
+    )
+    id = db.Column(db.Integer, primary_key=True)
+    paciente_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
+    medico_id = db.Column(db.String(50), nullable=False)  # Cambiar a String para IDs de NestJS
+    fecha_hora = db.Column(db.DateTime, nullable=False)
+    motivo = db.Column(db.Text)
+    estado = db.Column(db.String(20), default='programada')
+    fecha_creacion = db.Column(db.DateTime, default=datetime.utcnow)
+    notas = db.Column(db.Text)
+    
+    # Propiedades para obtener datos del médico desde NestJS
+    @property
+    def medico(self):
+        """Obtener datos del médico desde el servicio NestJS"""
+        return employees_service.get_doctor_by_id(self.medico_id)
+    
+    @property
+    def medico_nombre(self):
+        """Obtener nombre del médico"""
+        medico = self.medico
+        return medico.get('name', 'Médico no encontrado') if medico else 'Médico no encontrado'
+
+@login_manager.user_loader
+def load_user(user_id):
+    return User.query.get(int(user_id))
+
+class CitaArchivada(db.Model):
+    """Citas completadas o canceladas antiguas, fuera de la tabla de trabajo"""
+    __tablename__ = 'cita_archivada'
+    id = db.Column(db.Integer, primary_key=True, autoincrement=False)  # Mismo id que tenía en Cita
+    paciente_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False, index=True)
+    medico_id = db.Column(db.String(50), nullable=False)
+    fecha_hora = db.Column(db.DateTime, nullable=False)
+    motivo = db.Column(db.Text)
+    estado = db.Column(db.String(20))
+    fecha_creacion = db.Column(db.DateTime)
+    notas = db.Column(db.Text)
+    fecha_archivado = db.Column(db.DateTime, default=datetime.utcnow)
+
+class RetencionHorario(db.Model):
+    """Retención temporal de un horario, visible para todos los workers"""
+    __tablename__ = 'retencion_horario'
+    __table_args__ = (db.UniqueConstraint('medico_id', 'fecha_hora'),)
+    id = db.Column(db.String(32), primary_key=True)
+    medico_id = db.Column(db.String(50), nullable=False)
+    fecha_hora = db.Column(db.DateTime, nullable=False)
+    paciente_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False, unique=True)  # una por paciente
+    expira = db.Column(db.Float, nullable=False, index=True)  # time.time() de vencimiento
+
+class CambioCita(db.Model):
+    """Registro de cambios de citas (outbox) con secuencia creciente para consumidores"""
+    __tablename__ = 'cambio_cita'
+    # AUTOINCREMENT en SQLite garantiza que una secuencia nunca se reutiliza
+    __table_args__ = {'sqlite_autoincrement': True}
+    seq = db.Column(db.Integer, primary_key=True, autoincrement=True)
+    cita_id = db.Column(db.Integer, nullable=False, index=True)
+    tipo = db.Column(db.String(20), nullable=False)  # creada, cancelada, completada, archivada
+    paciente_id = db.Column(db.Integer)
+    medico_id = db.Column(db.String(50))
+    fecha_hora = db.Column(db.DateTime)
+    estado = db.Column(db.String(20))
+    fecha_cambio = db.Column(db.DateTime, default=datetime.utcnow, index=True)
+
+class SolicitudCita(db.Model):
+    """Solicitud de cita en la cola de reservas; el id fija el orden FIFO"""
+    __tablename__ = 'solicitud_cita'
+    __table_args__ = {'sqlite_autoincrement': True}
+    id = db.Column(db.Integer, primary_key=True, autoincrement=True)
+    ticket = db.Column(db.String(32), nullable=False, unique=True)
+    paciente_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
+    medico_id = db.Column(db.String(50), nullable=False)
+    medico_nombre = db.Column(db.String(100))
+    fecha_hora = db.Column(db.DateTime, nullable=False)
+    motivo = db.Column(db.Text)
+    estado = db.Column(db.String(20), nullable=False, default='pendiente', index=True)  # pendiente, confirmada, conflicto, error
+    cita_id = db.Column(db.Integer)
+    mensaje = db.Column(db.Text)
+    encolada = db.Column(db.Float, nullable=False)  # time.time()
+    procesada = db.Column(db.Float, index=True)
+
+class CerrojoEscritor(db.Model):
+    """Concesión con vencimiento que elige un único escritor entre todos los workers"""
+    __tablename__ = 'cerrojo_escritor'
+    nombre = db.Column(db.String(50), primary_key=True)
+    dueno = db.Column(db.String(32), nullable=False)
+    expira = db.Column(db.Float, nullable=False)  # time.time() de vencimiento
@@ -0,0 +1,216 @@
+import importlib
+import logging
+import math
+import os
+import sqlite3
+import threading
+import time
+from typing import Dict, Optional, Tuple
+from flask import Flask, jsonify, request
+from flask_login import current_user
+
+PERIODOS = {'second': 1, 'minute': 60, 'hour': 3600, 'day': 86400}
+
+def parse_limite(limite: str) -> Tuple[float, float]:
+    """'30/minute' -> (capacidad 30, 0.5 fichas por segundo)"""
+    cantidad, periodo = limite.split('/')
+    cantidad = float(cantidad)
+    return cantidad, cantidad / PERIODOS[periodo.strip()]
+
+class MemoryBackend:
+    """Cubetas de fichas en memoria del proceso (un límite independiente por worker).
+
+    Cada cubeta guarda cuándo vuelve a estar llena; una cubeta llena equivale
+    a una clave ausente, así que cada PURGA_CADA segundos se descartan todas
+    las que ya se llenaron y la memoria no crece con cada IP que pasa.
+    """
+
+    PURGA_CADA = 60.0
+
+    def __init__(self):
+        self._cubetas: Dict[str, Tuple[float, float, float]] = {}  # clave -> (fichas, ultima, llena_en)
+        self._lock = threading.Lock()
+        self._proxima_purga = time.monotonic() + self.PURGA_CADA
+
+    def _purgar(self, ahora: float) -> None:
+        self._cubetas = {clave: cubeta for clave, cubeta in self._cubetas.items() if cubeta[2] > ahora}
+        self._proxima_purga = ahora + self.PURGA_CADA
+
+    def consume(self, clave: str, capacidad: float, ritmo: float) -> Tuple[bool, float]:
+        """Gastar una ficha; devuelve (permitido, segundos hasta la próxima ficha)"""
+        ahora = time.monotonic()
+        with self._lock:
+            if ahora >= self._proxima_purga:
+                self._purgar(ahora)
+            fichas, ultima, _ = self._cubetas.get(clave, (capacidad, ahora, ahora))
+            fichas = min(capacidad, fichas + (ahora - ultima) * ritmo)
+            permitido = fichas >= 1
+            if permitido:
+                fichas -= 1
+            self._cubetas[clave] = (fichas, ahora, ahora + (capacidad - fichas) / ritmo)
+            return permitido, 0.0 if permitido else (1 - fichas) / ritmo
+
+class SQLiteBackend:
+    """Cubetas de fichas en un archivo SQLite compartido por todos los workers de la máquina.
+
+    Si el archivo sigue bloqueado tras el timeout la petición se deja pasar:
+    un límite que no se puede consultar no debe convertirse en un 500.
+    Como en MemoryBackend, cada fila guarda cuándo vuelve a estar llena y
+    cada PURGA_CADA segundos cada proceso borra las que ya se llenaron.
+    """
+
+    PURGA_CADA = 60.0
+
+    def __init__(self, path: str):
+        self.path = path
+        self._local = threading.local()
+        self._proxima_purga = time.time() + self.PURGA_CADA
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        with self._connect() as conn:
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('CREATE TABLE IF NOT EXISTS cubeta (clave TEXT PRIMARY KEY, fichas REAL NOT NULL, '
+                         'ultima REAL NOT NULL, llena_en REAL NOT NULL DEFAULT 0)')
+            columnas = {fila[1] for fila in conn.execute('PRAGMA table_info(cubeta)')}
+            if 'llena_en' not in columnas:
+                # Archivo creado por una versión anterior; sus cubetas se purgan en la primera pasada
+                conn.execute('ALTER TABLE cubeta ADD COLUMN llena_en REAL NOT NULL DEFAULT 0')
+            conn.execute('CREATE INDEX IF NOT EXISTS ix_cubeta_llena_en ON cubeta (llena_en)')
+
+    def _connect(self) -> sqlite3.Connection:
+        conn = getattr(self._local, 'conn', None)
+        if conn is None or getattr(self._local, 'pid', None) != os.getpid():
+            conn = sqlite3.connect(self.path, timeout=1, isolation_level=None)
+            self._local.conn, self._local.pid = conn, os.getpid()
+        return conn
+
+    def consume(self, clave: str, capacidad: float, ritmo: float) -> Tuple[bool, float]:
+        ahora = time.time()
+        try:
+            conn = self._connect()
+            conn.execute('BEGIN IMMEDIATE')
+        except sqlite3.OperationalError as e:
+            logging.warning(f"Límite de peticiones no disponible ({e}); se deja pasar {clave}")
+            return True, 0.0
+        try:
+            fila = conn.execute('SELECT fichas, ultima FROM cubeta WHERE clave = ?', (clave,)).fetchone()
+            fichas, ultima = fila if fila else (capacidad, ahora)
+            fichas = min(capacidad, fichas + max(0.0, ahora - ultima) * ritmo)
+            permitido = fichas >= 1
+            if permitido:
+                fichas -= 1
+            conn.execute('INSERT OR REPLACE INTO cubeta (clave, fichas, ultima, llena_en) VALUES (?, ?, ?, ?)',
+                         (clave, fichas, ahora, ahora + (capacidad - fichas) / ritmo))
+            if ahora >= self._proxima_purga:
+                self._proxima_purga = ahora + self.PURGA_CADA
+                conn.execute('DELETE FROM cubeta WHERE llena_en <= ?', (ahora,))
+            conn.execute('COMMIT')
+        except sqlite3.OperationalError as e:
+            if conn.in_transaction:
+                conn.execute('ROLLBACK')
+            logging.warning(f"Límite de peticiones no disponible ({e}); se deja pasar {clave}")
+            return True, 0.0
+        except Exception:
+            conn.execute('ROLLBACK')
+            raise
+        return permitido, 0.0 if permitido else (1 - fichas) / ritmo
+
+def crear_backend(app: Flask):
+    """'memory', 'sqlite' o la ruta 'modulo:Clase' de un backend propio con método consume()"""
+    nombre = app.config['RATE_LIMIT_BACKEND']
+    if nombre == 'memory':
+        return MemoryBackend()
+    if nombre == 'sqlite':
+        return SQLiteBackend(app.config.get('RATE_LIMIT_SQLITE_PATH') or
+                             os.path.join(app.instance_path, 'rate_limits.db'))
+    modulo, clase = nombre.split(':')
+    return getattr(importlib.import_module(modulo), clase)()
+
+def _rechazar(estado: int, mensaje: str, retry_after: float):
+    response = jsonify({'error': mensaje, 'reintentar_en': math.ceil(retry_after)})
+    response.status_code = estado
+    response.headers['Retry-After'] = str(max(1, math.ceil(retry_after)))
+    return response
+
+class AdmissionControl:
+    """Límites por usuario/IP y por ruta, y rechazo rápido cuando el proceso está saturado"""
+
+    def __init__(self, app: Flask):
+        self.app = app
+        self.backend = crear_backend(app)
+        self.limites = {
+            endpoint: {quien: parse_limite(limite) for quien, limite in limites.items()}
+            for endpoint, limites in app.config['RATE_LIMITS'].items()
+        }
+        self.max_en_curso = app.config['MAX_IN_FLIGHT']
+        self._en_curso = 0
+        self._lock = threading.Lock()
+
+    def reset_after_fork(self) -> None:
+        self._en_curso = 0
+        self._lock = threading.Lock()
+        if isinstance(self.backend, MemoryBackend):
+            self.backend = MemoryBackend()
+
+    def _limitar(self, endpoint: str):
+        limites = self.limites.get(endpoint)
+        if not limites:
+            return None
+        claves = {'ip': f'ip:{request.remote_addr}:{endpoint}'}
+        if current_user.is_authenticated:
+            claves['usuario'] = f'u:{current_user.id}:{endpoint}'
+        for quien, clave in claves.items():
+            if quien not in limites:
+                continue
+            permitido, espera = self.backend.consume(clave, *limites[quien])
+            if not permitido:
+                return _rechazar(429, 'Demasiadas solicitudes, intente de nuevo más tarde', espera)
+        return None
+
+    def _upstream_saturado(self, endpoint: str) -> Optional[float]:
+        """Segundos a esperar si esta ruta tendría que esperar a un NestJS lento"""
+        if endpoint not in self.app.config['UPSTREAM_ENDPOINTS']:
+            return None
+        service = self.app.extensions.get('employees_service')
+        if service is None or service.has_directory():
+            return None
+        if (service.upstream_latency or 0) <= self.app.config['UPSTREAM_LATENCY_LIMIT']:
+            return None
+        # Sin copia del directorio: refrescar en segundo plano en vez de bloquear la petición
+        service.refresh_async()
+        return service.upstream_latency
+
+    def before_request(self):
+        endpoint = request.endpoint
+        if endpoint is None or endpoint == 'static':
+            return None
+
+        rechazo = self._limitar(endpoint)
+        if rechazo is not None:
+            return rechazo
+
+        espera = self._upstream_saturado(endpoint)
+        if espera is not None:
+            return _rechazar(503, 'El directorio de médicos no está disponible, intente de nuevo en unos segundos',
+                             espera)
+
+        with self._lock:
+            if self.max_en_curso and self._en_curso >= self.max_en_curso:
+                return _rechazar(503, 'Servidor saturado, intente de nuevo en unos segundos', 1)
+            self._en_curso += 1
+        request.environ['citas.admitida'] = True
+        return None
+
+    def teardown_request(self, exc=None):
+        if request.environ.pop('citas.admitida', False):
+            with self._lock:
+                self._en_curso -= 1
+
+    def estado(self) -> Dict:
+        return {'en_curso': self._en_curso, 'max_en_curso': self.max_en_curso}
+
+def init_app(app: Flask) -> AdmissionControl:
+    control = AdmissionControl(app)
+    app.extensions['admission_control'] = control
+    app.before_request(control.before_request)
+    app.teardown_request(control.teardown_request)
+    return control
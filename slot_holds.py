@@ -0,0 +1,125 @@
+import time
+import uuid
+from datetime import date, datetime, time as dtime, timedelta
+from typing import Dict, Iterable, Optional, Set, Tuple
+from flask import current_app
+from sqlalchemy import delete, select, tuple_
+from sqlalchemy.exc import IntegrityError
+from extensions import db
+from models import RetencionHorario
+
+Slot = Tuple[str, datetime]
+
+class SlotHoldRegistry:
+    """Retenciones temporales de horarios mientras el paciente completa la reserva.
+
+    Las retenciones se guardan en la tabla retencion_horario para que todos
+    los workers las vean. Cada paciente puede retener un único horario a la
+    vez y un horario solo puede tener una retención (restricciones únicas).
+    Las lecturas ignoran las vencidas; al retener se borran todas las
+    vencidas con una sola sentencia sobre el índice de 'expira'.
+    """
+
+    def __init__(self, ttl: int = 300):
+        self.ttl = ttl
+
+    def _sweep(self, now: float) -> None:
+        db.session.execute(delete(RetencionHorario).where(RetencionHorario.expira <= now))
+
+    def hold(self, medico_id: str, fecha_hora: datetime, paciente_id: int) -> Optional[Dict]:
+        """Retener (o renovar) un horario; devuelve None si otro paciente ya lo tiene retenido"""
+        now = time.time()
+        try:
+            self._sweep(now)
+            retencion = db.session.execute(select(RetencionHorario).where(
+                RetencionHorario.medico_id == medico_id,
+                RetencionHorario.fecha_hora == fecha_hora
+            )).scalar_one_or_none()
+            if retencion is not None and retencion.paciente_id != paciente_id:
+                db.session.commit()
+                return None
+
+            if retencion is None:
+                # Liberar la retención anterior del paciente, si la tenía
+                db.session.execute(delete(RetencionHorario).where(RetencionHorario.paciente_id == paciente_id))
+                retencion = RetencionHorario(id=uuid.uuid4().hex, medico_id=medico_id,
+                                             fecha_hora=fecha_hora, paciente_id=paciente_id)
+                db.session.add(retencion)
+            retencion.expira = now + self.ttl
+            hold = {
+                'id': retencion.id,
+                'medico_id': medico_id,
+                'fecha_hora': fecha_hora,
+                'paciente_id': paciente_id,
+                'expira': retencion.expira,
+            }
+            db.session.commit()
+        except IntegrityError:
+            # Otro paciente retuvo el mismo horario a la vez desde otro worker
+            db.session.rollback()
+            return None
+        return hold
+
+    def release(self, hold_id: str, paciente_id: int) -> bool:
+        """Liberar una retención propia"""
+        resultado = db.session.execute(delete(RetencionHorario).where(
+            RetencionHorario.id == hold_id,
+            RetencionHorario.paciente_id == paciente_id,
+            RetencionHorario.expira > time.time()
+        ))
+        db.session.commit()
+        return resultado.rowcount > 0
+
+    def release_slots(self, slots: Iterable[Slot]) -> None:
+        """Liberar las retenciones de estos horarios en la transacción actual (al confirmar las citas)"""
+        slots = list(slots)
+        if slots:
+            db.session.execute(delete(RetencionHorario).where(
+                tuple_(RetencionHorario.medico_id, RetencionHorario.fecha_hora).in_(slots)
+            ))
+
+    def release_slot(self, medico_id: str, fecha_hora: datetime) -> None:
+        self.release_slots([(medico_id, fecha_hora)])
+
+    def holder(self, medico_id: str, fecha_hora: datetime) -> Optional[int]:
+        """Paciente que retiene el horario, o None si está libre"""
+        return db.session.execute(select(RetencionHorario.paciente_id).where(
+            RetencionHorario.medico_id == medico_id,
+            RetencionHorario.fecha_hora == fecha_hora,
+            RetencionHorario.expira > time.time()
+        )).scalar_one_or_none()
+
+    def held_slots(self, medico_id: str, fechas: Iterable[datetime],
+                   paciente_id: Optional[int] = None) -> Set[datetime]:
+        """Cuáles de estos horarios del médico retienen otros pacientes (una consulta)"""
+        consulta = select(RetencionHorario.fecha_hora).where(
+            RetencionHorario.medico_id == medico_id,
+            RetencionHorario.fecha_hora.in_(list(fechas)),
+            RetencionHorario.expira > time.time()
+        )
+        if paciente_id is not None:
+            consulta = consulta.where(RetencionHorario.paciente_id != paciente_id)
+        return set(db.session.execute(consulta).scalars())
+
+    def held_times(self, medico_id: str, fecha: date,
+                   paciente_id: Optional[int] = None) -> Set[dtime]:
+        """Horas retenidas de un médico en un día, sin contar las del propio paciente"""
+        inicio = datetime.combine(fecha, dtime.min)
+        consulta = select(RetencionHorario.fecha_hora).where(
+            RetencionHorario.medico_id == medico_id,
+            RetencionHorario.fecha_hora >= inicio,
+            RetencionHorario.fecha_hora < inicio + timedelta(days=1),
+            RetencionHorario.expira > time.time()
+        )
+        if paciente_id is not None:
+            consulta = consulta.where(RetencionHorario.paciente_id != paciente_id)
+        return {fecha_hora.time() for fecha_hora in db.session.execute(consulta).scalars()}
+
+def get_slot_holds() -> SlotHoldRegistry:
+    """Registro de retenciones de la aplicación actual"""
+    registry = current_app.extensions.get('slot_holds')
+    if registry is None:
+        registry = current_app.extensions.setdefault(
+            'slot_holds', SlotHoldRegistry(current_app.config['SLOT_HOLD_TTL'])
+        )
+    return registry
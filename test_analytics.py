@@ -0,0 +1,61 @@
+from datetime import date, datetime, timedelta
+from analytics import capacidad_por_hora, ocupacion
+from extensions import db
+from maintenance import ejecutar_mantenimiento
+from models import Cita
+
+MEDICOS = [
+    {'id': 'd1', 'name': 'Dra. Ana', 'especialidad': 'Cardiología',
+     'horario_inicio': '08:00', 'horario_fin': '10:00', 'duracion_cita': 30},
+    {'id': 'd2', 'name': 'Dr. Luis', 'especialidad': 'Cardiología',
+     'horario_inicio': '09:00', 'horario_fin': '10:30', 'duracion_cita': 60},
+]
+
+def test_capacidad_por_hora():
+    d1, d2 = (capacidad_por_hora(m) for m in MEDICOS)
+    assert d1[8] == 2 and d1[9] == 2 and d1.sum() == 4
+    # 09:00 y 10:00; el hueco de las 10:00 termina después de horario_fin pero empieza antes
+    assert d2[9] == 1 and d2[10] == 1 and d2.sum() == 2
+
+def test_horario_invalido_no_tiene_capacidad():
+    assert capacidad_por_hora(dict(MEDICOS[0], horario_inicio=None)).sum() == 0
+    assert capacidad_por_hora(dict(MEDICOS[0], horario_fin='diez')).sum() == 0
+
+def test_ocupacion_calculada_a_mano(app):
+    # 2030-01-07 es lunes y 2030-01-08 martes
+    db.session.add_all([
+        Cita(paciente_id=1, medico_id='d1', fecha_hora=datetime(2030, 1, 7, 8, 0)),
+        Cita(paciente_id=1, medico_id='d1', fecha_hora=datetime(2030, 1, 7, 8, 30)),
+        Cita(paciente_id=1, medico_id='d1', fecha_hora=datetime(2030, 1, 8, 9, 0)),
+        Cita(paciente_id=1, medico_id='d2', fecha_hora=datetime(2030, 1, 8, 9, 0), estado='completada'),
+        Cita(paciente_id=1, medico_id='d2', fecha_hora=datetime(2030, 1, 8, 10, 0), estado='cancelada'),
+        Cita(paciente_id=1, medico_id='d1', fecha_hora=datetime(2030, 1, 9, 8, 0)),  # fuera del rango
+    ])
+    db.session.commit()
+
+    resultado = ocupacion(MEDICOS, date(2030, 1, 7), date(2030, 1, 8))
+
+    assert resultado['dias'] == 2
+    d1, d2 = resultado['por_medico']
+    assert (d1['citas'], d1['capacidad'], d1['ocupacion']) == (3, 8, 0.375)
+    assert (d2['citas'], d2['capacidad'], d2['ocupacion']) == (1, 4, 0.25)
+    assert resultado['por_especialidad'] == [
+        {'especialidad': 'Cardiología', 'citas': 4, 'capacidad': 12, 'ocupacion': 0.3333}]
+    # Capacidad diaria: 4 (d1) + 2 (d2) = 6
+    assert [d['ocupacion'] for d in resultado['por_dia']] == [round(2 / 6, 4), 0.3333]
+    # Hora 8: 2 de 4; hora 9: 2 de 6; hora 10: 0 de 2
+    assert resultado['por_hora'][8:11] == [0.5, 0.3333, 0.0]
+    mapa = resultado['mapa_calor']['ocupacion']
+    assert mapa[0][8] == 1.0            # lunes 08:00: 2 de 2
+    assert mapa[1][9] == round(2 / 3, 4)  # martes 09:00: 2 de 3
+    assert mapa[2] == [0.0] * 24          # miércoles fuera del rango
+
+def test_ocupacion_incluye_citas_archivadas(app):
+    hace_120_dias = datetime.now().replace(hour=8, minute=0, second=0, microsecond=0) - timedelta(days=120)
+    db.session.add(Cita(paciente_id=1, medico_id='d1', fecha_hora=hace_120_dias, estado='completada'))
+    db.session.commit()
+    dia = hace_120_dias.date()
+    assert ocupacion(MEDICOS, dia, dia)['por_medico'][0]['citas'] == 1
+
+    assert ejecutar_mantenimiento(dias=90)['archivadas'] == 1
+    assert ocupacion(MEDICOS, dia, dia)['por_medico'][0]['citas'] == 1
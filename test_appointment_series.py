@@ -0,0 +1,17 @@
+from datetime import date, datetime, time
+from appointment_series import alternativas, generar_fechas
+from doctor_schedule import horarios_del_medico
+
+MEDICO = {'horario_inicio': '08:00', 'horario_fin': '10:00', 'duracion_cita': 30}
+PEDIDA = datetime(2030, 1, 7, 9, 0)
+
+def test_rejilla_con_duracion_cero_usa_30_minutos():
+    assert horarios_del_medico(dict(MEDICO, duracion_cita=0)) == [time(8), time(8, 30), time(9), time(9, 30)]
+
+def test_serie_hasta_antes_del_inicio_esta_vacia():
+    assert generar_fechas(PEDIDA, 'semanal', hasta=date(2030, 1, 1)) == []
+
+def test_alternativas_excluyen_ocupados_y_retenidos():
+    rejilla = horarios_del_medico(MEDICO)
+    assert alternativas(PEDIDA, rejilla, {PEDIDA}) == ['08:00', '08:30', '09:30']
+    assert alternativas(PEDIDA, rejilla, {PEDIDA}, retenidas={time(8, 30)}) == ['08:00', '09:30']
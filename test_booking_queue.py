@@ -0,0 +1,71 @@
+import types
+from datetime import datetime
+import pytest
+import booking_queue
+from booking_queue import BookingQueue
+from extensions import db
+from models import CambioCita, Cita
+
+A = datetime(2030, 1, 7, 9, 0)
+B = datetime(2030, 1, 7, 10, 0)
+
+@pytest.fixture
+def reloj(monkeypatch):
+    ahora = [1000.0]
+    monkeypatch.setattr(booking_queue, 'time', types.SimpleNamespace(
+        time=lambda: ahora[0], monotonic=lambda: ahora[0], sleep=lambda s: None))
+    return ahora
+
+def test_conflictos_en_orden_fifo(app, reloj):
+    db.session.add(Cita(paciente_id=9, medico_id='d2', fecha_hora=A))
+    db.session.commit()
+    cola = BookingQueue(app)
+    tickets = [
+        cola.submit(1, 'd1', A, 'primero', 'Dra. Ana'),
+        cola.submit(2, 'd1', A, 'segundo', 'Dra. Ana'),  # mismo horario, llegó después
+        cola.submit(2, 'd1', B, None, 'Dra. Ana'),
+        cola.submit(3, 'd2', A, None, 'Dr. Luis'),       # ya ocupado en la base de datos
+    ]
+    assert cola.pending() == 4
+
+    assert cola.process_pending() == 4
+
+    estados = [cola.status(t) for t in tickets]
+    assert [e['estado'] for e in estados] == ['confirmada', 'conflicto', 'confirmada', 'conflicto']
+    primera = db.session.get(Cita, estados[0]['cita_id'])
+    assert (primera.paciente_id, primera.motivo) == (1, 'primero')
+    assert 'ya está ocupado' in estados[1]['mensaje'] and estados[1]['cita_id'] is None
+    assert cola.pending() == 0
+    assert CambioCita.query.filter_by(tipo='creada').count() == 2
+
+def test_solo_un_escritor_y_relevo_al_vencer(app, reloj):
+    primero, segundo = BookingQueue(app, concesion=10), BookingQueue(app, concesion=10)
+    ticket = segundo.submit(1, 'd1', A, None, 'Dra. Ana')
+    assert primero.process_pending() == 1
+    assert segundo.process_pending() == 0
+
+    # El primer escritor desaparece sin renovar; al vencer la concesión otro la toma
+    ticket = segundo.submit(1, 'd1', B, None, 'Dra. Ana')
+    reloj[0] += 11
+    assert segundo.process_pending() == 1
+    assert segundo.status(ticket)['estado'] == 'confirmada'
+
+def test_lote_de_un_escritor_relevado_no_se_confirma(app, reloj):
+    viejo, nuevo = BookingQueue(app, concesion=10), BookingQueue(app, concesion=10)
+    assert viejo._adquirir()
+    reloj[0] += 11
+    assert nuevo._adquirir()
+    ticket = nuevo.submit(1, 'd1', A, None, 'Dra. Ana')
+    # 'viejo' aún cree ser el escritor, pero su concesión ya no está en la base de datos
+    viejo._lider_hasta = reloj[0] + 10
+    viejo.process_pending()
+    assert viejo.status(ticket)['estado'] == 'pendiente'
+    assert Cita.query.count() == 0
+
+def test_resultados_antiguos_se_purgan(app, reloj):
+    cola = BookingQueue(app, result_ttl=600)
+    ticket = cola.submit(1, 'd1', A, None, 'Dra. Ana')
+    cola.process_pending()
+    reloj[0] += 601
+    cola.process_pending()
+    assert cola.status(ticket) is None
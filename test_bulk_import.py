@@ -0,0 +1,86 @@
+import io
+from datetime import datetime
+import pytest
+from sqlalchemy.exc import IntegrityError
+import bulk_import
+from bulk_import import ImportadorCitas, importar_citas
+from extensions import db, employees_service
+from models import Cita, User
+
+MEDICOS = [{'id': 'd1', 'name': 'Dra. Ana', 'activo': True}]
+
+CSV = """medico_id,paciente_id,fecha_hora,estado
+d1,1,2030-01-07T09:00:00,programada
+d9,1,2030-01-07T09:30:00,programada
+d1,1,ayer,programada
+d1,99,2030-01-07T10:00:00,programada
+d1,1,2030-01-07T10:30:00,pospuesta
+d1,2,2030-01-07T09:00:00,programada
+d1,1,2020-01-07T09:00:00,completada
+d1,1,2020-01-07T09:00:00,cancelada
+d1,1,2020-01-07T09:00:00,completada
+"""
+
+@pytest.fixture
+def pacientes(app, monkeypatch):
+    monkeypatch.setattr(employees_service, 'get_all_doctors', lambda: MEDICOS)
+    db.session.add_all([User(id=i, email=f'p{i}@example.com', nombre=f'P{i}', password_hash='x') for i in (1, 2)])
+    db.session.commit()
+
+def test_reporte_por_fila(pacientes):
+    reporte = importar_citas(io.StringIO(CSV), 'csv', chunk_size=4)
+    assert (reporte['total'], reporte['insertadas'], reporte['conflictos'],
+            reporte['duplicadas'], reporte['errores']) == (9, 3, 1, 1, 4)
+    assert [(f['fila'], f['estado']) for f in reporte['filas']] == [
+        (2, 'error'), (3, 'error'), (4, 'error'), (5, 'error'), (6, 'conflicto'), (9, 'duplicada')]
+    assert reporte['filas'][0]['motivo'] == 'El médico con ID d9 no existe'
+    assert reporte['ultima_fila_confirmada'] == 9 and 'interrumpida' not in reporte
+
+def test_reimportar_no_duplica_el_historial(pacientes):
+    importar_citas(io.StringIO(CSV), 'csv')
+    reporte = importar_citas(io.StringIO(CSV), 'csv')
+    assert (reporte['insertadas'], reporte['duplicadas'], reporte['conflictos']) == (0, 4, 1)
+    assert Cita.query.count() == 3
+
+def test_bloque_reintentado_tras_integrity_error(pacientes, monkeypatch):
+    original = ImportadorCitas._insertar
+    llamadas = []
+
+    def insertar(self, validas):
+        llamadas.append(1)
+        if len(llamadas) == 1:
+            # Otro proceso confirma el mismo horario entre la consulta y el commit
+            db.session.add(Cita(paciente_id=2, medico_id='d1', fecha_hora=datetime(2030, 1, 7, 9, 0)))
+            db.session.commit()
+            raise IntegrityError('INSERT', {}, Exception('UNIQUE constraint failed'))
+        return original(self, validas)
+
+    monkeypatch.setattr(ImportadorCitas, '_insertar', insertar)
+    reporte = importar_citas(io.StringIO(CSV.splitlines()[0] + '\nd1,1,2030-01-07T09:00:00,programada\n'), 'csv')
+    assert len(llamadas) == 2
+    assert (reporte['insertadas'], reporte['conflictos']) == (0, 1)
+
+def test_fallo_a_mitad_devuelve_reporte_parcial(pacientes, monkeypatch):
+    original = ImportadorCitas._insertar
+    llamadas = []
+
+    def insertar(self, validas):
+        llamadas.append(1)
+        if len(llamadas) == 2:
+            raise RuntimeError('disco lleno')
+        return original(self, validas)
+
+    monkeypatch.setattr(ImportadorCitas, '_insertar', insertar)
+    reporte = importar_citas(io.StringIO(CSV), 'csv', chunk_size=4)
+    assert reporte['interrumpida'] == 'disco lleno'
+    assert (reporte['ultima_fila_confirmada'], reporte['insertadas']) == (4, 1)
+
+    monkeypatch.setattr(ImportadorCitas, '_insertar', original)
+    reporte = importar_citas(io.StringIO(CSV), 'csv', chunk_size=4)
+    assert (reporte['insertadas'], reporte['duplicadas']) == (2, 2)
+    assert Cita.query.count() == 3
+
+def test_fecha_con_zona_horaria_se_normaliza(pacientes):
+    reporte = importar_citas(io.StringIO('medico_id,paciente_id,fecha_hora\nd1,1,2030-01-07T09:00:00Z\n'), 'csv')
+    assert reporte['insertadas'] == 1
+    assert Cita.query.one().fecha_hora.tzinfo is None
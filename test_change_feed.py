@@ -0,0 +1,56 @@
+from datetime import datetime, timedelta
+from change_feed import ESPERA_HUECOS, cambios_desde
+from extensions import db
+from models import CambioCita, Cita
+
+FUTURA = datetime(2030, 1, 7, 9, 0)
+
+def _cambio(seq, medico_id='d1', antiguedad=timedelta(0)):
+    return CambioCita(seq=seq, cita_id=seq, tipo='creada', medico_id=medico_id, fecha_hora=FUTURA,
+                      estado='programada', fecha_cambio=datetime.utcnow() - antiguedad)
+
+def test_no_avanza_mas_alla_de_un_hueco_reciente(app):
+    db.session.add_all([_cambio(1), _cambio(2), _cambio(4)])
+    db.session.commit()
+    datos = cambios_desde(0)
+    assert [c['seq'] for c in datos['cambios']] == [1, 2] and datos['cursor'] == 2
+    # Si el seq 3 se confirma tarde, el consumidor aún lo ve
+    db.session.add(_cambio(3))
+    db.session.commit()
+    assert [c['seq'] for c in cambios_desde(2)['cambios']] == [3, 4]
+
+def test_hueco_antiguo_se_da_por_definitivo(app):
+    db.session.add_all([_cambio(1), _cambio(3)])
+    db.session.commit()
+    despues = datetime.utcnow() + ESPERA_HUECOS
+    assert cambios_desde(0, ahora=despues)['cursor'] == 3
+
+def test_filtro_por_medico_avanza_el_cursor(app):
+    db.session.add_all([_cambio(1, 'd1'), _cambio(2, 'd2'), _cambio(3, 'd2')])
+    db.session.commit()
+    datos = cambios_desde(0, medico_id='d1')
+    assert [c['seq'] for c in datos['cambios']] == [1] and datos['cursor'] == 3
+
+def test_cancelar_dos_veces_no_anuncia_el_horario(cliente):
+    cita = Cita(paciente_id=1, medico_id='d1', fecha_hora=FUTURA)
+    db.session.add(cita)
+    db.session.commit()
+    assert cliente.post(f'/cancelar-cita/{cita.id}').status_code == 200
+    assert cliente.post(f'/cancelar-cita/{cita.id}').status_code == 400
+    assert [c.tipo for c in CambioCita.query.order_by(CambioCita.seq)] == ['cancelada']
+
+def test_cancelar_todas_registra_solo_las_programadas(cliente):
+    db.session.add_all([
+        Cita(paciente_id=1, medico_id='d1', fecha_hora=FUTURA),
+        Cita(paciente_id=1, medico_id='d1', fecha_hora=FUTURA, estado='cancelada'),
+        Cita(paciente_id=1, medico_id='d2', fecha_hora=FUTURA, motivo='control'),
+    ])
+    db.session.commit()
+    respuesta = cliente.post('/admin/cancelar-todas-citas-seguro', json={'confirmar_cancelacion': 'SI_CANCELAR_TODAS'})
+    assert respuesta.status_code == 200
+    datos = respuesta.get_json()
+    assert datos['citas_canceladas'] == 2
+    assert {(c['id'], c['paciente'], c['motivo']) for c in datos['citas_info']} == {
+        (1, 'Paciente', None), (3, 'Paciente', 'control')}
+    assert sorted(c.cita_id for c in CambioCita.query.filter_by(tipo='cancelada')) == [1, 3]
+    assert cliente.post('/admin/cancelar-todas-citas').get_json()['citas_canceladas'] == 0
@@ -0,0 +1,44 @@
+from doctor_search import DoctorSearchIndex, normalizar
+
+MEDICOS = [
+    {'id': 'd1', 'name': 'Dra. Ana Pérez', 'especialidad': 'Cardiología', 'activo': True},
+    {'id': 'd2', 'name': 'Dr. Luis Gómez', 'especialidad': 'Pediatría', 'activo': True},
+    {'id': 'd3', 'name': 'Dr. Andrés Ruiz', 'especialidad': 'Cardiología', 'activo': False},
+]
+
+def indice():
+    indice = DoctorSearchIndex()
+    indice.update(MEDICOS)
+    return indice
+
+def test_normalizar_quita_tildes_y_mayusculas():
+    assert normalizar('Cardiología') == 'cardiologia'
+    assert normalizar(None) == ''
+
+def test_buscar_sin_tildes_encuentra_con_tildes():
+    resultados = indice().search('cardiologia')
+    assert {d['id'] for d in resultados} == {'d1', 'd3'}
+    assert all(d['especialidad'] == 'Cardiología' for d in resultados)
+
+def test_buscar_por_prefijo_y_varios_terminos():
+    assert {d['id'] for d in indice().search('an')} == {'d1', 'd3'}
+    # Una palabra completa igual al término va primero
+    assert [d['id'] for d in indice().search('ana')] == ['d1']
+    assert [d['id'] for d in indice().search('andres card')] == ['d3']
+    assert indice().search('an pedia') == []
+
+def test_filtros_activo_y_especialidad():
+    assert [d['id'] for d in indice().search('dr', activo=False)] == ['d3']
+    assert [d['id'] for d in indice().search('dr', especialidad='pediatria')] == ['d2']
+
+def test_por_especialidad_en_orden_del_directorio():
+    assert [d['id'] for d in indice().by_specialty('CARDIOLOGIA')] == ['d1', 'd3']
+
+def test_actualizar_solo_reindexa_los_cambios():
+    i = indice()
+    assert i.update(MEDICOS) == 0
+    cambiados = [dict(MEDICOS[0], especialidad='Neurología'), MEDICOS[1]]
+    assert i.update(cambiados) == 2  # d1 cambió y d3 desapareció
+    assert len(i) == 2
+    assert i.search('cardio') == []
+    assert [d['id'] for d in i.by_specialty('neurologia')] == ['d1']
@@ -0,0 +1,49 @@
+from datetime import datetime, timedelta
+from sqlalchemy import text
+from app import init_db
+from extensions import db
+from maintenance import ejecutar_mantenimiento
+from models import Cita, CitaArchivada
+
+def test_id_archivado_no_se_reutiliza(app):
+    antigua = datetime.now().replace(hour=8, minute=0, second=0, microsecond=0) - timedelta(days=120)
+    db.session.add_all([
+        Cita(paciente_id=1, medico_id='d1', fecha_hora=antigua + timedelta(days=400)),
+        Cita(paciente_id=1, medico_id='d1', fecha_hora=antigua, estado='completada'),
+    ])
+    db.session.commit()
+    assert ejecutar_mantenimiento(dias=90)['archivadas'] == 1
+    assert db.session.get(CitaArchivada, 2) is not None
+
+    nueva = Cita(paciente_id=1, medico_id='d1', fecha_hora=antigua + timedelta(hours=1), estado='completada')
+    db.session.add(nueva)
+    db.session.commit()
+    assert nueva.id == 3
+
+    assert ejecutar_mantenimiento(dias=90)['archivadas'] == 1
+    assert {c.id for c in CitaArchivada.query.all()} == {2, 3}
+
+def test_init_db_reconstruye_cita_sin_autoincrement(app):
+    db.session.remove()
+    with db.engine.begin() as conn:
+        conn.execute(text('DROP TABLE cita'))
+        conn.execute(text('CREATE TABLE cita (id INTEGER PRIMARY KEY, paciente_id INTEGER NOT NULL, '
+                          'medico_id VARCHAR(50) NOT NULL, fecha_hora DATETIME NOT NULL, motivo TEXT, '
+                          'estado VARCHAR(20), fecha_creacion DATETIME, notas TEXT)'))
+        conn.execute(text("INSERT INTO cita (id, paciente_id, medico_id, fecha_hora, estado) "
+                          "VALUES (1, 1, 'd1', '2030-01-07 08:00:00', 'programada')"))
+        conn.execute(text("INSERT INTO cita_archivada (id, paciente_id, medico_id, fecha_hora, estado) "
+                          "VALUES (7, 1, 'd1', '2020-01-07 08:00:00', 'completada')"))
+
+    init_db()
+
+    with db.engine.connect() as conn:
+        sql = conn.execute(text("SELECT sql FROM sqlite_master WHERE name = 'cita'")).scalar()
+        indices = conn.execute(text("SELECT name FROM sqlite_master WHERE tbl_name = 'cita' AND type = 'index'")).scalars().all()
+    assert 'AUTOINCREMENT' in sql
+    assert 'uq_cita_medico_horario_programada' in indices
+    assert Cita.query.one().medico_id == 'd1'
+    nueva = Cita(paciente_id=1, medico_id='d1', fecha_hora=datetime(2030, 1, 7, 9, 0))
+    db.session.add(nueva)
+    db.session.commit()
+    assert nueva.id == 8
@@ -0,0 +1,88 @@
+import sqlite3
+import types
+import pytest
+import rate_limit
+from app import create_app
+from config import TestingConfig
+from rate_limit import MemoryBackend, SQLiteBackend, parse_limite
+
+@pytest.fixture
+def reloj(monkeypatch):
+    ahora = [1000.0]
+    monkeypatch.setattr(rate_limit, 'time', types.SimpleNamespace(monotonic=lambda: ahora[0],
+                                                                   time=lambda: ahora[0]))
+    return ahora
+
+def test_parse_limite():
+    assert parse_limite('30/minute') == (30.0, 0.5)
+
+def test_cubeta_se_rellena_con_el_tiempo(reloj):
+    backend = MemoryBackend()
+    capacidad, ritmo = parse_limite('2/minute')  # una ficha cada 30 s
+    assert backend.consume('k', capacidad, ritmo) == (True, 0.0)
+    assert backend.consume('k', capacidad, ritmo) == (True, 0.0)
+    assert backend.consume('k', capacidad, ritmo) == (False, 30.0)
+    reloj[0] += 20
+    permitido, espera = backend.consume('k', capacidad, ritmo)
+    assert not permitido and espera == pytest.approx(10.0)
+    reloj[0] += 10
+    assert backend.consume('k', capacidad, ritmo) == (True, 0.0)
+
+def test_cubetas_llenas_se_purgan(reloj):
+    backend = MemoryBackend()
+    capacidad, ritmo = parse_limite('2/minute')
+    backend.consume('a', capacidad, ritmo)
+    reloj[0] += 45  # 'a' se volvió a llenar a los 30 s
+    backend.consume('b', capacidad, ritmo)
+    reloj[0] += MemoryBackend.PURGA_CADA - 45  # 'b' aún no está llena
+    backend.consume('c', capacidad, ritmo)
+    assert set(backend._cubetas) == {'b', 'c'}
+
+def test_sqlite_bloqueado_deja_pasar(tmp_path, reloj):
+    ruta = str(tmp_path / 'limites.db')
+    backend = SQLiteBackend(ruta)
+    otra = sqlite3.connect(ruta, isolation_level=None)
+    otra.execute('BEGIN IMMEDIATE')
+    try:
+        backend._connect().execute('PRAGMA busy_timeout = 0')
+        assert backend.consume('k', 1, 1) == (True, 0.0)
+    finally:
+        otra.execute('ROLLBACK')
+    assert backend.consume('k', 1, 1) == (True, 0.0)
+    assert backend.consume('k', 1, 1) == (False, 1.0)
+
+def test_sqlite_purga_cubetas_llenas(tmp_path, reloj):
+    backend = SQLiteBackend(str(tmp_path / 'limites.db'))
+    capacidad, ritmo = parse_limite('2/minute')
+    backend.consume('a', capacidad, ritmo)
+    reloj[0] += 45
+    backend.consume('b', capacidad, ritmo)
+    reloj[0] += SQLiteBackend.PURGA_CADA - 45
+    backend.consume('c', capacidad, ritmo)
+    claves = {clave for (clave,) in backend._connect().execute('SELECT clave FROM cubeta')}
+    assert claves == {'b', 'c'}
+
+def test_sqlite_migra_archivo_sin_llena_en(tmp_path, reloj):
+    ruta = str(tmp_path / 'limites.db')
+    conn = sqlite3.connect(ruta)
+    conn.execute('CREATE TABLE cubeta (clave TEXT PRIMARY KEY, fichas REAL NOT NULL, ultima REAL NOT NULL)')
+    conn.commit()
+    conn.close()
+    assert SQLiteBackend(ruta).consume('k', 1, 1) == (True, 0.0)
+
+def test_429_con_retry_after(app):
+    client = app.test_client()
+    for _ in range(20):  # main.login: 20/minute por IP
+        assert client.get('/login').status_code == 200
+    response = client.get('/login')
+    assert response.status_code == 429
+    assert response.headers['Retry-After'] == '3'
+    assert response.get_json()['reintentar_en'] == 3
+
+def test_proxy_fix_limita_por_ip_del_cliente(monkeypatch):
+    monkeypatch.setattr(TestingConfig, 'PROXY_FIX_X_FOR', 1)
+    client = create_app('testing').test_client()
+    for _ in range(20):
+        client.get('/login', headers={'X-Forwarded-For': '203.0.113.1'})
+    assert client.get('/login', headers={'X-Forwarded-For': '203.0.113.1'}).status_code == 429
+    assert client.get('/login', headers={'X-Forwarded-For': '203.0.113.2'}).status_code == 200
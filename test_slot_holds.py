@@ -0,0 +1,58 @@
+import types
+from datetime import date, datetime, time
+import pytest
+import slot_holds
+from slot_holds import SlotHoldRegistry
+
+HORARIO = datetime(2030, 1, 2, 9, 0)
+
+@pytest.fixture
+def reloj(monkeypatch):
+    ahora = [1000.0]
+    monkeypatch.setattr(slot_holds, 'time', types.SimpleNamespace(time=lambda: ahora[0]))
+    return ahora
+
+@pytest.fixture
+def registro(app, reloj):
+    return SlotHoldRegistry(ttl=300)
+
+def test_retencion_bloquea_a_otro_paciente(registro):
+    hold = registro.hold('d1', HORARIO, 1)
+    assert hold['expira'] == 1300.0
+    assert registro.hold('d1', HORARIO, 2) is None
+    assert registro.holder('d1', HORARIO) == 1
+
+def test_retencion_vence_sola(registro, reloj):
+    registro.hold('d1', HORARIO, 1)
+    reloj[0] += 299
+    assert registro.holder('d1', HORARIO) == 1
+    reloj[0] += 1
+    assert registro.holder('d1', HORARIO) is None
+    assert registro.hold('d1', HORARIO, 2) is not None
+
+def test_renovar_conserva_id_y_extiende_vencimiento(registro, reloj):
+    hold = registro.hold('d1', HORARIO, 1)
+    reloj[0] += 200
+    renovada = registro.hold('d1', HORARIO, 1)
+    assert renovada['id'] == hold['id']
+    assert renovada['expira'] == 1500.0
+    reloj[0] += 250  # el vencimiento original ya pasó
+    assert registro.holder('d1', HORARIO) == 1
+
+def test_una_retencion_por_paciente(registro):
+    registro.hold('d1', HORARIO, 1)
+    registro.hold('d1', HORARIO.replace(hour=10), 1)
+    assert registro.holder('d1', HORARIO) is None
+    assert registro.held_times('d1', date(2030, 1, 2)) == {time(10, 0)}
+
+def test_horas_retenidas_excluyen_las_propias(registro):
+    registro.hold('d1', HORARIO, 1)
+    registro.hold('d1', HORARIO.replace(hour=11), 2)
+    assert registro.held_times('d1', date(2030, 1, 2), paciente_id=1) == {time(11, 0)}
+    assert registro.held_slots('d1', [HORARIO, HORARIO.replace(hour=11)], 2) == {HORARIO}
+
+def test_liberar_solo_la_propia(registro):
+    hold = registro.hold('d1', HORARIO, 1)
+    assert not registro.release(hold['id'], 2)
+    assert registro.release(hold['id'], 1)
+    assert registro.holder('d1', HORARIO) is None
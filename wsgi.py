@@ -0,0 +1,15 @@
+"""Punto de entrada WSGI para producción.
+
+Ejemplo con gunicorn (usa gunicorn.conf.py de este directorio)::
+
+    flask --app app init-db          # una sola vez, antes de arrancar los workers
+    gunicorn wsgi:app
+
+La aplicación se crea una vez en el proceso maestro (preload_app) y cada
+worker hereda el código ya importado; las conexiones a la base de datos y el
+estado del servicio de empleados se reinician en cada worker tras el fork.
+"""
+import os
+from app import create_app
+
+app = create_app(os.getenv('FLASK_CONFIG', 'production'))